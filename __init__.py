@@ -63,18 +63,27 @@ if "bpy" in locals():
     imp.reload(import_export)
     imp.reload(preferences)
     imp.reload(pointcloud_simulator)
+    imp.reload(render_farm)
+    imp.reload(render_manifest)
+    imp.reload(render_cache)
+    imp.reload(writer_pool)
+    imp.reload(pfm)
+    imp.reload(view_store)
+    imp.reload(lightfield_container)
 else:
-    from . import gui, lightfield_simulator, updates, import_export, preferences, pointcloud_simulator
+    from . import gui, lightfield_simulator, updates, import_export, preferences, pointcloud_simulator, render_farm, render_manifest, render_cache, writer_pool, pfm, view_store, lightfield_container
     
 import bpy
 from bpy.props import *
 
 import datetime
 import os, sys
+import numpy as np
 
 from . import gui
 from . import lightfield_simulator
 from . import pointcloud_simulator
+from . import render_farm
 from . import import_export
 from . import preferences
 from .preferences import *
@@ -188,6 +197,12 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
         default=False,
         description='Whether to show one camera or all of them.'
     )
+    use_virtual_rig: BoolProperty(
+        name='Virtual camera rig',
+        default=False,
+        description='Use a single camera that is moved to every view while rendering instead of one camera per view',
+        update=updates.update_lightfield
+    )
     
 
     # Light field parameters
@@ -239,11 +254,28 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
         description='Number of captures for the focus stack generation',
         update=updates.update_lightfield
     )
+    use_synthetic_focus_stack: BoolProperty(
+        name='Synthesize focus stack',
+        default=False,
+        description='Compute the focus stack by refocusing the rendered light field views instead of rendering it'
+    )
     depth_map_scale: FloatProperty(
         name='Depth Map Scale',
         default=10.0,
         description='Factor for the high resolution depth map export'
     )
+    artefact_window_radius: IntProperty(
+        name='Artefact window radius',
+        default=1,
+        min=1,
+        description='Radius of the window whose median replaces depth pixels outside the range of the low resolution depth map'
+    )
+    artefact_max_iterations: IntProperty(
+        name='Artefact iterations',
+        default=10,
+        min=1,
+        description='Maximum number of passes over the depth artefacts, holes up to iterations * radius pixels wide are closed'
+    )
     save_depth_for_all_views: BoolProperty(
         name='Save depth maps for all views',
         default=False,
@@ -269,6 +301,11 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
         default=False,
         description='Save all of the rendered perspectives as a lenslet image'
     )
+    save_container: BoolProperty(
+        name='Save lightfield as a container file',
+        default=False,
+        description='Save all perspectives, depth, disparity and object id maps as one memory mappable file'
+    )
     save_sidebyside_image: BoolProperty(
         name='Save lightfield as a side-by-side image',
         default=False,
@@ -291,6 +328,58 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
         max=20,
         description='Step length from one to the next frame, i.e. to downsample the movie'
     )
+    use_single_pass: BoolProperty(
+        name='Single pass',
+        default=False,
+        description='Render image, object ids and depth of a view in one high resolution render with the '
+                    'scene render engine, the input view is downsampled from the high resolution image. '
+                    'Depth and object ids come from the scene engine (e.g. Cycles with depth of field) instead '
+                    'of EEVEE, these passes are not anti-aliased and are jittered at defocused edges'
+    )
+    render_seed: IntProperty(
+        name='Seed',
+        default=-1,
+        min=-1,
+        description='Base render seed of the views, -1 to pick a random seed for every render'
+    )
+    use_render_cache: BoolProperty(
+        name='Use render cache',
+        default=False,
+        description='Reuse identical renders of earlier runs from the render cache instead of rendering them again'
+    )
+    render_cache_dir: StringProperty(
+        name='',
+        subtype='DIR_PATH',
+        default=os.path.join(bpy.context.preferences.filepaths.temporary_directory, 'lightfield_cache'),
+        description='Directory of the render cache'
+    )
+    render_cache_size_mb: IntProperty(
+        name='Cache size [MB]',
+        default=4096,
+        min=1,
+        description='Maximum size of the render cache, least recently used renders are removed first'
+    )
+    view_store_size_mb: IntProperty(
+        name='View memory [MB]',
+        default=1024,
+        min=0,
+        description='Memory for decoded views shared by the lenslet, side-by-side and point cloud outputs, '
+                    'least recently used views are dropped first'
+    )
+    decode_workers: IntProperty(
+        name='Decode threads',
+        default=8,
+        min=1,
+        max=256,
+        description='Number of threads decoding views for the lenslet image and the point cloud'
+    )
+    farm_workers: IntProperty(
+        name='Worker processes',
+        default=4,
+        min=1,
+        max=256,
+        description='Number of background Blender processes sharing the views of the light field'
+    )
     
     
     # File IO
@@ -375,6 +464,30 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
         default='PointCloud0',
         description='Name of the ply file to be saved'
     )
+    use_point_cloud_fusion: BoolProperty(
+        name='Fuse all views',
+        default=False,
+        description='Merge the point clouds of all views with saved disparity maps through a voxel grid'
+    )
+    point_cloud_voxel_size: FloatProperty(
+        name='Voxel size [m]',
+        default=0.005,
+        min=0.00001,
+        precision=4,
+        description='Edge length of the voxels, points of all views within one voxel are merged'
+    )
+    use_point_cloud_lod: BoolProperty(
+        name='Level of detail',
+        default=False,
+        description='Additionally write an octree level of detail hierarchy with one file per level and a JSON node index'
+    )
+    point_cloud_lod_levels: IntProperty(
+        name='Levels',
+        default=6,
+        min=1,
+        max=16,
+        description='Number of levels of detail, the last level holds all points'
+    )
 
     # Private variables to manage internal computations, no access from GUI interface
     baseline_x_m: FloatProperty(
@@ -397,6 +510,9 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
     num_cams_y_hidden: IntProperty(
         default=0
     )
+    rig_state: StringProperty(
+        default=''
+    )
     center_cam_x: FloatProperty(
         name='x',
         default=0.0,
@@ -463,6 +579,37 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
 
         return camera
 
+    def get_camera_indices(self):
+        return range(0, self.num_cams_x * self.num_cams_y)
+
+    def get_center_camera_index(self):
+        return int((self.num_cams_y - 1) / 2) * self.num_cams_x + int((self.num_cams_x - 1) / 2)
+
+    def get_camera_table(self):
+        """
+        Position and sensor shift of every view in the light field container,
+        one row (x, y, shift_x, shift_y) per camera index
+        """
+        if self.focus_dist == 0:
+            factor = 0  # focused at infinity
+        else:
+            factor = self.focal_length / self.sensor_size / self.focus_dist
+
+        pos_x = self.baseline_x_m * (np.arange(self.num_cams_x) - (self.num_cams_x - 1) / 2.0)
+        pos_y = -self.baseline_y_m * (np.arange(self.num_cams_y) - (self.num_cams_y - 1) / 2.0)
+        pos_x, pos_y = [pos.ravel() for pos in np.meshgrid(pos_x, pos_y)]
+
+        return np.stack((pos_x, pos_y, -pos_x * factor, -pos_y * factor), axis=1)
+
+    def get_sequence_frames(self):
+        return range(self.sequence_start, self.sequence_end + 1, self.sequence_steps)
+
+    def get_frame_directory(self, frame):
+        # single frames are rendered to the target directory, sequences to one folder per frame
+        if self.sequence_start == self.sequence_end:
+            return bpy.path.abspath(self.tgt_dir)
+        return os.path.join(bpy.path.abspath(self.tgt_dir), "sequence", "{:06d}".format(frame))
+
     def get_frustum(self):
         return bpy.data.objects[self.get_frustum_name()]
     
@@ -479,6 +626,9 @@ class LFPropertyGroup(bpy.types.PropertyGroup):
     def get_camera_name(self, i, j):
         return "LF%s_Cam%3.3i" % (self.setup_number, i*self.num_cams_x+j)
 
+    def get_camera_name_by_index(self, idx):
+        return "LF%s_Cam%3.3i" % (self.setup_number, idx)
+
     def get_lightfield_name(self):
         return "LF%s" % self.setup_number
 
@@ -508,6 +658,7 @@ def register():
     gui.register();
     preferences.register();
     pointcloud_simulator.register();
+    render_farm.register();
 
     bpy.types.Scene.LF = bpy.props.PointerProperty(type=LFPropertyGroup)
 
@@ -520,6 +671,7 @@ def unregister():
     gui.unregister();
     preferences.unregister();
     pointcloud_simulator.unregister();
+    render_farm.unregister();
     
 
 if __name__ == "__main__":
@@ -70,6 +70,7 @@ class VIEW3D_PT_camera_setup(bpy.types.Panel):
         row.prop(LF, "num_cams_x", text="X:")
         row.prop(LF, "num_cams_y", text="Y: ")
         col.prop(LF, "baseline_mm")
+        col.prop(LF, "use_virtual_rig")
         col = box.column(align=True)
         if LF.show_one_camera == False:
             col.operator("scene.hide_cameras", text="Show only center camera", icon="HAND")
@@ -105,6 +106,8 @@ class VIEW3D_PT_camera_setup(bpy.types.Panel):
         box.label(text="Save settings")
         col = box.column(align=True)
         col.prop(LF, "depth_map_scale")
+        col.prop(LF, "artefact_window_radius")
+        col.prop(LF, "artefact_max_iterations")
         col.prop(LF, "sequence_start")
         col.prop(LF, "sequence_end")
         col.prop(LF, "sequence_steps")
@@ -125,6 +128,11 @@ class VIEW3D_PT_render_setup(bpy.types.Panel):
         box = layout.box()
         col = box.column(align=True)
         col.prop(LF, "tgt_dir")
+        col.prop(LF, "render_seed")
+        col.prop(LF, "use_render_cache")
+        if LF.use_render_cache:
+            col.prop(LF, "render_cache_dir")
+            col.prop(LF, "render_cache_size_mb")
         
         box = layout.box()
         box.label(text="Light Field")
@@ -134,6 +142,7 @@ class VIEW3D_PT_render_setup(bpy.types.Panel):
         col = box.column(align=True)
         row.prop(LF, "save_lenslet_image", text="Lenslet")
         row.prop(LF, "save_sidebyside_image", text="Side-by-side")
+        row.prop(LF, "save_container", text="Container")
         
         col.label(text="Save depth and disparity maps as:")
         row = box.row(align=True)
@@ -144,9 +153,13 @@ class VIEW3D_PT_render_setup(bpy.types.Panel):
         row = box.row(align=True)
         col.prop(LF, "save_depth_for_all_views")     
         col.prop(LF, "save_object_id_maps_for_all_views")
+        col.prop(LF, "use_single_pass")
+        col.prop(LF, "view_store_size_mb")
+        col.prop(LF, "decode_workers")
         col = box.column(align=True)
         col.prop(LF, "focus_separation")
         col.prop(LF, "focus_steps")
+        col.prop(LF, "use_synthetic_focus_stack")
         focus_planes_name = bpy.context.scene.LF.get_focus_planes_name()
         if bpy.data.objects[focus_planes_name].hide_viewport == True:
             col.operator("scene.show_focus_planes", text="Show focus range", icon="HAND")
@@ -155,6 +168,9 @@ class VIEW3D_PT_render_setup(bpy.types.Panel):
         col = box.column(align=True)
         col.label(text="Render Light Field as:")
         col.operator("scene.render_lightfield", text="Multiple views", icon="OUTLINER_DATA_CAMERA")
+        row = col.row(align=True)
+        row.operator("scene.render_farm", text="Multiple views (workers)", icon="OUTLINER_DATA_CAMERA")
+        row.prop(LF, "farm_workers", text="")
         col = box.column(align=True)
         col.operator("scene.render_focus_stack", text="Focus stack", icon="NODE_COMPOSITING")
 
@@ -162,6 +178,12 @@ class VIEW3D_PT_render_setup(bpy.types.Panel):
         box.label(text="Point Cloud")
         col = box.column(align=True)
         col.prop(LF, "point_cloud_name")
+        col.prop(LF, "use_point_cloud_fusion")
+        if LF.use_point_cloud_fusion:
+            col.prop(LF, "point_cloud_voxel_size")
+        col.prop(LF, "use_point_cloud_lod")
+        if LF.use_point_cloud_lod:
+            col.prop(LF, "point_cloud_lod_levels")
         col = box.column(align=True)
         col.label(text="Render Point Cloud:")
         col.operator("scene.render_pointcloud", text="From generated views", icon="OUTLINER_OB_POINTCLOUD")
@@ -48,6 +48,8 @@ import bpy
 from bpy.props import *
 import configparser
 
+from . import updates
+
 
 class OBJECT_OT_save_lightfield(bpy.types.Operator):
     """Save config file with camera setup"""
@@ -57,6 +59,19 @@ class OBJECT_OT_save_lightfield(bpy.types.Operator):
 
     def execute(self, context):
         LF = bpy.context.scene.LF
+        parser = self.get_parser(LF)
+
+        with open(bpy.path.abspath(LF.path_config_file), "w") as f:
+            parser.write(f)
+
+        return {'FINISHED'}
+
+    @classmethod
+    def get_parser(cls, LF):
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        Light field parameters of the config file, also written
+        to the header of light field containers
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
         parser = configparser.ConfigParser(delimiters="=")
 
         section = "intrinsics"
@@ -88,7 +103,7 @@ class OBJECT_OT_save_lightfield(bpy.types.Operator):
         except:
             pass
 
-        parser.set(section, 'offset', str(self.get_offset(LF)))
+        parser.set(section, 'offset', str(cls.get_offset(LF)))
 
         section = "meta"
         parser.add_section(section)
@@ -105,13 +120,13 @@ class OBJECT_OT_save_lightfield(bpy.types.Operator):
         parser.set(section, 'frustum_disp_min', str(LF.frustum_min_disp))
         parser.set(section, 'frustum_disp_max', str(LF.frustum_max_disp))
         parser.set(section, 'depth_map_scale', str(LF.depth_map_scale))
+        parser.set(section, 'artefact_window_radius', str(LF.artefact_window_radius))
+        parser.set(section, 'artefact_max_iterations', str(LF.artefact_max_iterations))
 
-        with open(bpy.path.abspath(LF.path_config_file), "w") as f:
-            parser.write(f)
-
-        return {'FINISHED'}
+        return parser
 
-    def get_offset(self, LF):
+    @staticmethod
+    def get_offset(LF):
         if LF.focus_dist > 0:
             offset = LF.baseline_mm * LF.focal_length / LF.focus_dist / 1000. / LF.sensor_size * max(LF.x_res, LF.y_res)
         else:
@@ -131,38 +146,43 @@ class OBJECT_OT_load_lightfield(bpy.types.Operator):
         parser = configparser.ConfigParser(delimiters="=")
         parser.read(bpy.path.abspath(LF.path_config_file))
 
-        section = "intrinsics"
-        LF.focal_length = float(parser.get(section, 'focal_length_mm'))
-        LF.x_res = int(parser.get(section, 'image_resolution_x_px'))
-        LF.y_res = int(parser.get(section, 'image_resolution_y_px'))
-        LF.sensor_size = float(parser.get(section, 'sensor_size_mm'))
-        LF.fstop = float(parser.get(section, 'fstop'))
-
-        section = "meta"
-        LF.scene = parser.get(section, 'scene')
-        LF.category = parser.get(section, 'category')
-        LF.date = parser.get(section, 'date')
-        LF.version = parser.get(section, 'version')
-        LF.authors = parser.get(section, 'authors')
-        LF.contact = parser.get(section, 'contact')
-        LF.frustum_min_disp = float(parser.get(section, 'frustum_disp_min'))
-        LF.frustum_max_disp = float(parser.get(section, 'frustum_disp_max'))
-        LF.min_disp = float(parser.get(section, 'disp_min'))
-        LF.max_disp = float(parser.get(section, 'disp_max'))
-        LF.depth_map_scale = float(parser.get(section, 'depth_map_scale'))
-        LF.cycles_seed = float(parser.get(section, 'cycles_seed'))
-
-        section = "extrinsics"
-        LF.num_cams_x = int(parser.get(section, 'num_cams_x'))
-        LF.num_cams_y = int(parser.get(section, 'num_cams_y'))
-        LF.baseline_mm = float(parser.get(section, 'baseline_mm'))
-        LF.focus_dist = float(parser.get(section, 'focus_distance_m'))
-        LF.center_cam_x = float(parser.get(section, 'center_cam_x_m'))
-        LF.center_cam_y = float(parser.get(section, 'center_cam_y_m'))
-        LF.center_cam_z = float(parser.get(section, 'center_cam_z_m'))
-        LF.center_cam_rot_x = float(parser.get(section, 'center_cam_rx_rad'))
-        LF.center_cam_rot_y = float(parser.get(section, 'center_cam_ry_rad'))
-        LF.center_cam_rot_z = float(parser.get(section, 'center_cam_rz_rad'))
+        # The light field is rebuilt once after all parameters are set
+        with updates.batched_updates(update=False):
+            section = "intrinsics"
+            LF.focal_length = float(parser.get(section, 'focal_length_mm'))
+            LF.x_res = int(parser.get(section, 'image_resolution_x_px'))
+            LF.y_res = int(parser.get(section, 'image_resolution_y_px'))
+            LF.sensor_size = float(parser.get(section, 'sensor_size_mm'))
+            LF.fstop = float(parser.get(section, 'fstop'))
+
+            section = "meta"
+            LF.scene = parser.get(section, 'scene')
+            LF.category = parser.get(section, 'category')
+            LF.date = parser.get(section, 'date')
+            LF.version = parser.get(section, 'version')
+            LF.authors = parser.get(section, 'authors')
+            LF.contact = parser.get(section, 'contact')
+            LF.frustum_min_disp = float(parser.get(section, 'frustum_disp_min'))
+            LF.frustum_max_disp = float(parser.get(section, 'frustum_disp_max'))
+            LF.min_disp = float(parser.get(section, 'disp_min'))
+            LF.max_disp = float(parser.get(section, 'disp_max'))
+            LF.depth_map_scale = float(parser.get(section, 'depth_map_scale'))
+            # missing in files saved by older versions
+            LF.artefact_window_radius = int(parser.get(section, 'artefact_window_radius', fallback=1))
+            LF.artefact_max_iterations = int(parser.get(section, 'artefact_max_iterations', fallback=10))
+            LF.cycles_seed = float(parser.get(section, 'cycles_seed'))
+
+            section = "extrinsics"
+            LF.num_cams_x = int(parser.get(section, 'num_cams_x'))
+            LF.num_cams_y = int(parser.get(section, 'num_cams_y'))
+            LF.baseline_mm = float(parser.get(section, 'baseline_mm'))
+            LF.focus_dist = float(parser.get(section, 'focus_distance_m'))
+            LF.center_cam_x = float(parser.get(section, 'center_cam_x_m'))
+            LF.center_cam_y = float(parser.get(section, 'center_cam_y_m'))
+            LF.center_cam_z = float(parser.get(section, 'center_cam_z_m'))
+            LF.center_cam_rot_x = float(parser.get(section, 'center_cam_rx_rad'))
+            LF.center_cam_rot_y = float(parser.get(section, 'center_cam_ry_rad'))
+            LF.center_cam_rot_z = float(parser.get(section, 'center_cam_rz_rad'))
 
         bpy.ops.scene.create_lightfield('EXEC_DEFAULT')
         return {'FINISHED'}
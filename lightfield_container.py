@@ -0,0 +1,115 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+# Light field container files.
+#
+# A container holds a rendered light field in a single file that can be memory mapped, so that
+# any view or pixel is read without decoding image files. The file starts with a 16 byte
+# preamble (magic, version and length of the header), followed by a JSON header and the raw
+# arrays, each aligned to CONTAINER_ALIGNMENT bytes:
+#
+#   parameters  sections of the parameters.cfg file of the light field
+#   arrays      name -> dtype, shape and offset from the start of the data block
+#
+# 'rgb' holds all views as (v, u, y, x, c) uint8 RGB. 'depth' and 'disp' (float32, low
+# resolution) and 'object_ids' (uint16, high resolution) are (n, y, x) stacks of the camera
+# indices in their 'views' list. Arrays are top-down like PNG files read with OpenCV.
+#
+# This module does not depend on Blender, so that containers can be read by any Python script.
+
+import os
+import json
+import struct
+
+import numpy as np
+
+
+CONTAINER_MAGIC = b'LFC\x00'
+CONTAINER_VERSION = 1
+CONTAINER_ALIGNMENT = 4096
+CONTAINER_PREAMBLE = struct.Struct('<4sIQ')
+
+
+def align(offset):
+    return -(-offset // CONTAINER_ALIGNMENT) * CONTAINER_ALIGNMENT
+
+
+class LightFieldContainer:
+    """
+    Memory mapped light field container, opened read-only (mode 'r') or writable (mode 'r+').
+    The arrays are available by name, e.g. container['rgb'][v, u], or by camera index with
+    get_view().
+    """
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        with open(path, 'rb') as container_file:
+            magic, version, header_length = CONTAINER_PREAMBLE.unpack(container_file.read(CONTAINER_PREAMBLE.size))
+            if magic != CONTAINER_MAGIC:
+                raise ValueError("Not a light field container: '%s'" % path)
+            if version > CONTAINER_VERSION:
+                raise ValueError("Light field container '%s' has the unsupported version %d" % (path, version))
+            self.header = json.loads(container_file.read(header_length).decode('utf-8'))
+
+        data_offset = align(CONTAINER_PREAMBLE.size + header_length)
+        self.parameters = self.header['parameters']
+        self.arrays = {}
+        for name, info in self.header['arrays'].items():
+            self.arrays[name] = np.memmap(path, dtype=np.dtype(info['dtype']), mode=mode,
+                                          offset=data_offset + info['offset'], shape=tuple(info['shape']))
+
+    @classmethod
+    def create(cls, path, parameters, arrays):
+        """
+        Creates a container with the given parameters (section -> key -> value) and arrays
+        (name -> dict of 'shape', 'dtype' and further header entries such as 'views') and
+        returns it opened writable. The arrays are zero-filled.
+        """
+        header = {'parameters': parameters, 'arrays': {}}
+        offset = 0
+        for name, info in arrays.items():
+            info = dict(info, dtype=np.dtype(info['dtype']).str, shape=[int(n) for n in info['shape']], offset=offset)
+            header['arrays'][name] = info
+            offset = align(offset + int(np.prod(info['shape'])) * np.dtype(info['dtype']).itemsize)
+
+        header = json.dumps(header, indent=1).encode('utf-8')
+        with open(path, 'wb') as container_file:
+            container_file.write(CONTAINER_PREAMBLE.pack(CONTAINER_MAGIC, CONTAINER_VERSION, len(header)))
+            container_file.write(header)
+            container_file.truncate(align(CONTAINER_PREAMBLE.size + len(header)) + offset)
+
+        return cls(path, mode='r+')
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def get_view(self, name, idx):
+        # Map or image of the camera with index idx (idx = v * num_cams_x + u)
+        info = self.header['arrays'][name]
+        if 'views' in info:
+            return self.arrays[name][info['views'].index(idx)]
+        return self.arrays[name][divmod(idx, self.arrays[name].shape[1])]
+
+    def flush(self):
+        for array in self.arrays.values():
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    def close(self):
+        self.flush()
+        self.arrays = {}
@@ -0,0 +1,186 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+# Reader of rendered light fields for scripts outside Blender.
+#
+# Opens a rendered target directory by its parameters.cfg and returns sub-aperture views,
+# epipolar plane images (EPIs) and pixel neighbourhoods as RGB arrays. With a light field
+# container (lightfield.lfc) in the directory, slices are read straight from the memory mapped
+# file, so only the pages holding the requested rows are touched. Otherwise the input_CamNNN.png
+# views are decoded on demand and kept in memory row by row in a least recently used cache, so
+# that the EPIs of further rows of the same views do not decode the files again.
+#
+# The module only needs numpy and OpenCV, e.g.
+#
+#   sys.path.append(path_of_the_addon)
+#   from lightfield_reader import LightFieldReader
+#   epi = LightFieldReader(tgt_dir).get_horizontal_epi(v=4, y=256)
+
+import os
+import configparser
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from .lightfield_container import LightFieldContainer
+    from .pfm import read_pfm
+except ImportError:
+    from lightfield_container import LightFieldContainer
+    from pfm import read_pfm
+
+
+class LightFieldReader:
+    """
+    Lazy reader of the light field rendered to tgt_dir. Views are addressed by their row v and
+    column u in the camera grid. Decoded rows are cached up to cache_mb megabytes, views are
+    decoded by num_workers threads. Of a decoded view, only the requested rows and the next
+    readahead_rows rows are cached, so that reading a large view does not flush the rows of all
+    other views. use_container=False reads the PNG files even if the directory has a container.
+    """
+
+    def __init__(self, tgt_dir, cache_mb=512, num_workers=8, use_container=True, readahead_rows=32):
+        self.tgt_dir = tgt_dir
+        config_path = os.path.join(tgt_dir, 'parameters.cfg')
+        parser = configparser.ConfigParser(delimiters="=")
+        if not parser.read(config_path):
+            raise FileNotFoundError("No light field parameters found: '%s'" % config_path)
+        self.parameters = {section: dict(parser.items(section)) for section in parser.sections()}
+
+        self.num_cams_x = parser.getint('extrinsics', 'num_cams_x')
+        self.num_cams_y = parser.getint('extrinsics', 'num_cams_y')
+        self.x_res = parser.getint('intrinsics', 'image_resolution_x_px')
+        self.y_res = parser.getint('intrinsics', 'image_resolution_y_px')
+
+        container_path = os.path.join(tgt_dir, 'lightfield.lfc')
+        self.container = None
+        if use_container and os.path.exists(container_path):
+            self.container = LightFieldContainer(container_path)
+
+        self.cache_bytes = cache_mb * 1024 * 1024
+        self.num_workers = num_workers
+        self.readahead_rows = readahead_rows
+        self.rows = OrderedDict()
+        self.num_bytes = 0
+        self.num_decoded = 0
+
+    def get_camera_index(self, v, u):
+        return v * self.num_cams_x + u
+
+    def decode_view(self, v, u):
+        import cv2
+
+        path = os.path.join(self.tgt_dir, 'input_Cam%3.3i.png' % self.get_camera_index(v, u))
+        image = cv2.imread(path)
+        if image is None:
+            raise FileNotFoundError("Could not read view '%s'" % path)
+        self.num_decoded += 1
+        return np.ascontiguousarray(image[:, :, ::-1])
+
+    def cache_rows(self, v, u, image, y_start=0):
+        # The rows of image are stored as rows y_start, y_start + 1, ... of view (v, u), most
+        # recently used last, the oldest rows are dropped beyond cache_bytes. The rows are copied,
+        # a view would keep the whole decoded image alive after the other rows of it are dropped,
+        # so cache_bytes would not bound the memory.
+        for y, row in enumerate(image, y_start):
+            key = (v, u, y)
+            if key in self.rows:
+                self.num_bytes -= self.rows.pop(key).nbytes
+            row = row.copy()
+            self.rows[key] = row
+            self.num_bytes += row.nbytes
+        while self.num_bytes > self.cache_bytes:
+            key, row = self.rows.popitem(last=False)
+            self.num_bytes -= row.nbytes
+
+    def get_rows(self, views, y_start, y_end):
+        """
+        Rows y_start to y_end of the given (v, u) views as a (views, rows, x, c) array
+        """
+        if self.container is not None:
+            rgb = self.container['rgb']
+            return np.stack([rgb[v, u, y_start:y_end] for v, u in views])
+
+        rows = np.empty((len(views), y_end - y_start, self.x_res, 3), dtype=np.uint8)
+        missing = []
+        for idx, (v, u) in enumerate(views):
+            keys = [(v, u, y) for y in range(y_start, y_end)]
+            if all(key in self.rows for key in keys):
+                for y, key in enumerate(keys):
+                    self.rows.move_to_end(key)
+                    rows[idx, y] = self.rows[key]
+            else:
+                missing.append(idx)
+
+        # Views with missing rows are decoded in parallel, OpenCV releases the GIL
+        with ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+            images = pool.map(lambda idx: self.decode_view(*views[idx]), missing)
+            for idx, image in zip(missing, images):
+                rows[idx] = image[y_start:y_end]
+                self.cache_rows(*views[idx], image[y_start:y_end + self.readahead_rows], y_start)
+        return rows
+
+    def get_view(self, v, u):
+        """
+        Sub-aperture view (y, x, c) of camera row v and column u
+        """
+        return self.get_rows([(v, u)], 0, self.y_res)[0]
+
+    def get_horizontal_epi(self, v, y):
+        """
+        EPI (u, x, c) of image row y across the views of camera row v
+        """
+        return self.get_rows([(v, u) for u in range(0, self.num_cams_x)], y, y + 1)[:, 0]
+
+    def get_vertical_epi(self, u, x):
+        """
+        EPI (v, y, c) of image column x across the views of camera column u
+        """
+        if self.container is not None:
+            return np.array(self.container['rgb'][:, u, :, x])
+        return self.get_rows([(v, u) for v in range(0, self.num_cams_y)], 0, self.y_res)[:, :, x]
+
+    def get_neighbourhood(self, y, x, radius, views=None):
+        """
+        Pixels within radius of pixel (y, x) in the given (v, u) views, all views by default,
+        as a (views, rows, columns, c) array. The window is clipped at the image borders.
+        """
+        if views is None:
+            views = [(v, u) for v in range(0, self.num_cams_y) for u in range(0, self.num_cams_x)]
+        x_start, x_end = max(x - radius, 0), min(x + radius + 1, self.x_res)
+        return self.get_rows(views, max(y - radius, 0), min(y + radius + 1, self.y_res))[:, :, x_start:x_end]
+
+    def get_map(self, name, v, u):
+        """
+        Low resolution 'depth' or 'disp' map or high resolution 'object_ids' map of a view.
+        Maps are rendered for all views or only for the center view, see save_depth_for_all_views.
+        """
+        idx = self.get_camera_index(v, u)
+        if self.container is not None and name in self.container:
+            return self.container.get_view(name, idx)
+
+        import cv2
+
+        if name == 'object_ids':
+            paths = ['objectids_highres_Cam%3.3i.png' % idx, 'objectids_highres.png']
+        else:
+            paths = ['gt_%s_lowres_Cam%3.3i.pfm' % (name, idx), 'gt_%s_lowres.pfm' % name]
+        center = self.get_camera_index((self.num_cams_y - 1) // 2, (self.num_cams_x - 1) // 2)
+        for path in paths if idx == center else paths[:1]:
+            path = os.path.join(self.tgt_dir, path)
+            if os.path.exists(path):
+                return read_pfm(path) if path.endswith('.pfm') else cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        raise FileNotFoundError("No %s map of view (%d, %d) in '%s'" % (name, v, u, self.tgt_dir))
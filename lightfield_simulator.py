@@ -47,20 +47,39 @@ import bpy
 from bpy.props import *
 
 import os
+import time
 import random
 import shutil
 import pathlib
 import numpy as np
-import configparser
 import glob
+import json
 
 from math import *
 from mathutils import *
 
+from .render_manifest import RenderManifest, get_parameter_hash, get_entry_hash
+from .render_cache import get_render_cache, get_render_key, get_scene_hash
+from .writer_pool import WriterPool
+from .pfm import write_pfm, read_pfm
+from .view_store import get_view_store, load_view_grid, iter_decoded
+from .lightfield_container import LightFieldContainer
+from .import_export import OBJECT_OT_save_lightfield
+
 __bpydoc__ = """
 Write me!
 """
 
+# Light field properties the rig objects are built from, grouped by the objects they change.
+# The state of the last build is kept in LF.rig_state, see OBJECT_OT_update_lightfield.
+RIG_CAMERA_PROPERTIES = ('num_cams_x', 'num_cams_y', 'focal_length', 'sensor_size', 'fstop', 'num_blades',
+                         'rotation', 'baseline_x_m', 'baseline_y_m', 'focus_dist')
+RIG_FRUSTUM_PROPERTIES = ('x_res', 'y_res', 'focal_length', 'sensor_size', 'baseline_x_m', 'focus_dist',
+                          'frustum_min_disp', 'frustum_max_disp')
+RIG_FOCUS_PLANES_PROPERTIES = ('num_cams_x', 'num_cams_y', 'focus_dist', 'focus_separation', 'focus_steps')
+RIG_PROPERTIES = ('setup_number', 'use_virtual_rig') + tuple(sorted(set(RIG_CAMERA_PROPERTIES + RIG_FRUSTUM_PROPERTIES
+                                                                        + RIG_FOCUS_PLANES_PROPERTIES)))
+
 class OBJECT_OT_show_focus_planes(bpy.types.Operator):
     """Show the focus range in the scene"""
     bl_idname = "scene.show_focus_planes"
@@ -179,9 +198,96 @@ class OBJECT_OT_update_lightfield(bpy.types.Operator):
         except KeyError:
             pass
 
-        bpy.ops.scene.create_lightfield('EXEC_DEFAULT')
+        if not self.update_in_place(LF):
+            bpy.ops.scene.create_lightfield('EXEC_DEFAULT')
         return {'FINISHED'}
 
+    def update_in_place(self, LF):
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        Patches the objects of the existing rig that depend on
+        the properties changed since the last update. Returns
+        False if the rig has to be created from scratch.
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        try:
+            lightfield = bpy.data.objects[LF.get_lightfield_name()]
+            frustum = LF.get_frustum()
+            focus_planes = LF.get_focus_planes()
+            previous_state = json.loads(LF.rig_state)
+        except (KeyError, ValueError):
+            return False
+
+        state = get_rig_state(LF)
+        changed = {name for name in RIG_PROPERTIES if previous_state.get(name) != state[name]}
+        if 'setup_number' in changed or 'use_virtual_rig' in changed:
+            return False
+
+        start = time.perf_counter()
+        if 'x_res' in changed or 'y_res' in changed:
+            OBJECT_OT_create_lightfield.set_render_properties()
+
+        if changed.intersection(RIG_CAMERA_PROPERTIES):
+            self.update_cameras(LF, lightfield)
+
+        if changed.intersection(RIG_FRUSTUM_PROPERTIES):
+            vertices, edges, faces = OBJECT_OT_create_lightfield.get_frustum_coordinates()
+            frustum.data.vertices.foreach_set('co', np.ravel(vertices))
+            frustum.data.update()
+
+        if changed.intersection(RIG_FOCUS_PLANES_PROPERTIES):
+            vertices, edges, faces = OBJECT_OT_create_lightfield.get_focus_planes_coordinates()
+            focus_planes.data.vertices.foreach_set('co', np.ravel(vertices))
+            focus_planes.data.update()
+
+        LF.rig_state = json.dumps(state)
+        print("Updated %s of the light field rig in %.3f s" % (sorted(changed), time.perf_counter() - start))
+        return True
+
+    def update_cameras(self, LF, lightfield):
+        # Cameras are only created or removed for the views added to or dropped from the grid,
+        # all others are moved and set up again
+        if LF.use_virtual_rig:
+            indices = [LF.get_center_camera_index()]
+        else:
+            indices = LF.get_camera_indices()
+        camera_names = [LF.get_camera_name_by_index(idx) for idx in indices]
+        center_camera_name = LF.get_camera_name_by_index(LF.get_center_camera_index())
+
+        prefix = "LF%s_Cam" % LF.setup_number
+        cameras = {obj.name: obj for obj in bpy.data.objects if obj.type == 'CAMERA' and obj.name.startswith(prefix)}
+        for camera_name in set(cameras) - set(camera_names):
+            camera_data = cameras[camera_name].data
+            bpy.data.objects.remove(cameras[camera_name], do_unlink=True)
+            if camera_data.users == 0:
+                bpy.data.cameras.remove(camera_data)
+
+        table = LF.get_camera_table()
+        for idx, camera_name in zip(indices, camera_names):
+            camera = cameras.get(camera_name)
+            if camera is None:
+                camera = bpy.data.objects.new(camera_name, bpy.data.cameras.new(camera_name))
+                bpy.context.collection.objects.link(camera)
+                camera.parent = lightfield
+                camera.data.display_size = 0.5
+                camera.data.dof.use_dof = True
+                camera.data.cycles.aperture_type = 'FSTOP'
+
+            pos_x, pos_y, shift_x, shift_y = table[idx]
+            camera.location = (pos_x, pos_y, 0)
+            camera.data.shift_x = shift_x
+            camera.data.shift_y = shift_y
+            camera.data.lens = LF.focal_length
+            camera.data.sensor_width = LF.sensor_size
+            camera.data.sensor_height = LF.sensor_size
+            camera.data.dof.focus_distance = LF.focus_dist if LF.focus_dist != 0 else 10000
+            camera.data.dof.aperture_fstop = LF.fstop
+            camera.data.cycles.aperture_fstop = LF.fstop
+            camera.data.cycles.aperture_blades = LF.num_blades
+            camera.data.cycles.aperture_rotation = LF.rotation
+
+            # the center view may change with the size of the grid
+            if LF.show_one_camera:
+                camera.hide_viewport = camera_name != center_camera_name
+
 
 class OBJECT_OT_create_lightfield(bpy.types.Operator):
     """Create the light field setup"""
@@ -266,21 +372,26 @@ class OBJECT_OT_create_lightfield(bpy.types.Operator):
         bpy.context.view_layer.objects.active = lightfield
         lightfield.select_set(True)
 
+        # later updates patch this rig in place
+        LF.rig_state = json.dumps(get_rig_state(LF))
+
         return {'FINISHED'}
 
     def create_cameras(self):
         LF = bpy.context.scene.LF
-        pos_x = -LF.baseline_x_m * ((LF.num_cams_x - 1) / 2.0)
-        pos_y = LF.baseline_y_m * ((LF.num_cams_y - 1) / 2.0)
         pos_z = 0
         cameras = []
 
-        for i in range(0, LF.num_cams_y):
-            for j in range(0, LF.num_cams_x):
-                cameras.append(self.create_camera(LF.get_camera_name(i, j), pos_x, pos_y, pos_z, 0, 0))
-                pos_x += LF.baseline_x_m
-            pos_y -= LF.baseline_y_m
-            pos_x = -LF.baseline_x_m * float(((LF.num_cams_x - 1) / 2.0))
+        # A virtual rig only keeps the center camera, which is moved to every view while rendering
+        if LF.use_virtual_rig:
+            indices = [LF.get_center_camera_index()]
+        else:
+            indices = LF.get_camera_indices()
+
+        table = LF.get_camera_table()
+        for idx in indices:
+            pos_x, pos_y = table[idx, 0:2]
+            cameras.append(self.create_camera(LF.get_camera_name_by_index(idx), pos_x, pos_y, pos_z, 0, 0))
 
         return cameras
 
@@ -320,7 +431,8 @@ class OBJECT_OT_create_lightfield(bpy.types.Operator):
 
         return camera
 
-    def get_frustum_coordinates(self):
+    @staticmethod
+    def get_frustum_coordinates():
         LF = bpy.context.scene.LF
         max_res = max(LF.x_res, LF.y_res)
 
@@ -382,26 +494,30 @@ class OBJECT_OT_create_lightfield(bpy.types.Operator):
 
         return frustum
     
-    def create_focus_planes(self):
+    @staticmethod
+    def get_focus_planes_coordinates():
         LF = bpy.context.scene.LF
-        
-        # Obtain world matrices to extract position and rotation for the planes
-        camera_name = LF.get_center_camera().name
-        world_matrix = bpy.data.objects[camera_name].matrix_world
-        world_matrix_rotation = bpy.data.objects[camera_name].matrix_world.to_euler()
-
-        vertices = [(world_matrix[0][3] - 5, world_matrix[1][3] - 5, world_matrix[2][3] - LF.focus_dist),
-                    (world_matrix[0][3] - 5, world_matrix[1][3] + 5, world_matrix[2][3] - LF.focus_dist),
-                    (world_matrix[0][3] + 5, world_matrix[1][3] + 5, world_matrix[2][3] - LF.focus_dist),
-                    (world_matrix[0][3] + 5, world_matrix[1][3] - 5, world_matrix[2][3] - LF.focus_dist),
-                    (world_matrix[0][3] - 5, world_matrix[1][3] - 5, world_matrix[2][3] - LF.focus_dist - LF.focus_separation * LF.focus_steps),
-                    (world_matrix[0][3] - 5, world_matrix[1][3] + 5, world_matrix[2][3] - LF.focus_dist - LF.focus_separation * LF.focus_steps),
-                    (world_matrix[0][3] + 5, world_matrix[1][3] + 5, world_matrix[2][3] - LF.focus_dist - LF.focus_separation * LF.focus_steps),
-                    (world_matrix[0][3] + 5, world_matrix[1][3] - 5, world_matrix[2][3] - LF.focus_dist - LF.focus_separation * LF.focus_steps)]
+
+        # The planes are placed around the center camera in the frame of the light field container
+        x, y, z = LF.get_center_camera().location
+
+        vertices = [(x - 5, y - 5, z - LF.focus_dist),
+                    (x - 5, y + 5, z - LF.focus_dist),
+                    (x + 5, y + 5, z - LF.focus_dist),
+                    (x + 5, y - 5, z - LF.focus_dist),
+                    (x - 5, y - 5, z - LF.focus_dist - LF.focus_separation * LF.focus_steps),
+                    (x - 5, y + 5, z - LF.focus_dist - LF.focus_separation * LF.focus_steps),
+                    (x + 5, y + 5, z - LF.focus_dist - LF.focus_separation * LF.focus_steps),
+                    (x + 5, y - 5, z - LF.focus_dist - LF.focus_separation * LF.focus_steps)]
                     
         edges = [(0, 4), (1, 5), (2, 6), (3, 7)]
         faces = [(0, 1, 2, 3), (4, 7, 6, 5)]
+        return vertices, edges, faces
 
+    def create_focus_planes(self):
+        LF = bpy.context.scene.LF
+
+        vertices, edges, faces = self.get_focus_planes_coordinates()
         mesh_data = bpy.data.meshes.new("FocusPlanesMeshData")
         mesh_data.from_pydata(vertices, edges, faces)
         mesh_data.update()
@@ -426,7 +542,8 @@ class OBJECT_OT_create_lightfield(bpy.types.Operator):
 
         return focus_planes
 
-    def set_render_properties(self):
+    @staticmethod
+    def set_render_properties():
         LF = bpy.context.scene.LF
         scene = bpy.data.scenes[bpy.context.scene.name]
         scene.render.resolution_x = LF.x_res
@@ -488,36 +605,154 @@ class OBJECT_OT_render_focus_stack(bpy.types.Operator):
         # +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
         LF = bpy.context.scene.LF
 
-        # legacy mode
-        if LF.sequence_start == LF.sequence_end:
-            bpy.context.scene.frame_current = LF.sequence_start
-            cameras_focus = self.create_cameras_focus()
-            self.renderFocus(cameras_focus)
-            self.delete_cameras_focus(cameras_focus)
-            
-        # when more then one frame should be rendered we render each frame to a different folder
-        else:
-            frame_list = range(LF.sequence_start, LF.sequence_end+1, LF.sequence_steps)
-            for i in frame_list:
+        # synthetic mode
+        # slices are refocused from the light field views rendered before
+        if LF.use_synthetic_focus_stack:
+            for i in LF.get_sequence_frames():
                 bpy.context.scene.frame_current = i
-                tgt_dir = os.path.join(bpy.path.abspath(LF.tgt_dir),"sequence","{:06d}".format(i))
-                cameras_focus = self.create_cameras_focus()
-                self.renderFocus(cameras_focus, tgt_dir)
-                self.delete_cameras_focus(cameras_focus)
+                self.synthesizeFocus(LF.get_frame_directory(i))
+            return {'FINISHED'}
+
+        # One camera and compositor setup is reused for all focus steps and frames,
+        # only the focus distance and the output path change between renders
+        camera = self.create_camera_focus()
+        image_out_node = self.create_output_node_focus()
+        try:
+            # legacy mode and sequence mode,
+            # when more then one frame should be rendered we render each frame to a different folder
+            for i in LF.get_sequence_frames():
+                bpy.context.scene.frame_current = i
+                self.renderFocus(camera, image_out_node, LF.get_frame_directory(i))
+        finally:
+            bpy.context.scene.node_tree.nodes.remove(image_out_node)
+            self.delete_camera_focus(camera)
 
         return {'FINISHED'}
     
-    def renderFocus(self, cameras, tgt_dir = None):
+    def renderFocus(self, camera, image_out_node, tgt_dir):
         """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
         Renders the currently selected frame with different focus distance
         """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
         LF = bpy.context.scene.LF
         scene_key = bpy.context.scene.name
 
-        tgt_root_dir = bpy.path.abspath(LF.tgt_dir)
+        # Outputs already rendered with the same parameters and scene are skipped
+        scene_hash = get_scene_hash()
+        manifest = RenderManifest(tgt_dir)
+        parameter_hash = get_parameter_hash(LF, scene_hash)
 
-        if tgt_dir == None:
-            tgt_dir = tgt_root_dir
+        # Identical renders of earlier runs are reused from the render cache
+        cache = get_render_cache(LF)
+
+        # Select center camera for rendering
+        seed = manifest.get_base_seed()
+        if LF.render_seed >= 0:
+            seed = LF.render_seed
+        elif seed is None:
+            seed = random.randint(0, 2147483646 - 10 - 1)
+        LF.cycles_seed = seed
+
+        # The focus camera follows the center camera of the current frame
+        location, rotation, scale = LF.get_center_camera().matrix_world.decompose()
+        camera.location = location
+        camera.rotation_euler = rotation.to_euler()
+
+        image_out_node.base_path = tgt_dir
+        bpy.data.scenes[scene_key].camera = camera
+
+        # Render view per focus distance
+        for focus_idx, focus in enumerate(self.get_focus_distances(LF)):
+            camera.data.dof.focus_distance = focus
+            focus = camera.data.dof.focus_distance
+            
+            image_filename = 'focus_' + str(trunc(focus))
+            entry_hash = get_entry_hash(parameter_hash, 'focus', focus, LF.cycles_seed)
+            if manifest.is_valid(image_filename, entry_hash):
+                print("Skipping focus %s, already rendered" % focus)
+                continue
+
+            if cache is not None:
+                cache_key = get_render_key(scene_hash, camera, LF.cycles_seed + focus_idx, 'focus')
+                if cache.fetch(cache_key, os.path.join(tgt_dir, image_filename + '.png')):
+                    print("Reusing cached render for focus %s" % focus)
+                    manifest.record(image_filename, entry_hash, LF.cycles_seed + focus_idx,
+                                    [image_filename + '.png'], base_seed=LF.cycles_seed)
+                    continue
+
+            print("Rendering scene with focus: " + str(focus))
+            image_out_node.file_slots[0].path = image_filename + '_frame###'
+
+            # Change seed
+            bpy.data.scenes[scene_key].cycles.seed = LF.cycles_seed + focus_idx
+            print("Cycles seed for focus step %d: %d" % (focus_idx, bpy.data.scenes[scene_key].cycles.seed))
+
+            # Render scene and adjust the file name
+            bpy.ops.render.render(write_still=True)
+            self.remove_blender_frame_from_file_name(image_filename, tgt_dir)
+            manifest.record(image_filename, entry_hash, bpy.data.scenes[scene_key].cycles.seed,
+                            [image_filename + '.png'], base_seed=LF.cycles_seed)
+            if cache is not None:
+                cache.store(cache_key, os.path.join(tgt_dir, image_filename + '.png'))
+        
+        print('Done!')
+
+
+    def synthesizeFocus(self, tgt_dir):
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        Computes the focus stack by shift-and-add refocusing of
+        the light field views rendered to tgt_dir
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        import cv2
+        from concurrent.futures import ThreadPoolExecutor
+
+        LF = bpy.context.scene.LF
+        views = load_view_grid(LF, tgt_dir)
+        if views is None:
+            self.report({'ERROR'}, "Render the light field views to %s before synthesizing the focus stack" % tgt_dir)
+            return
+        views = views.reshape((-1,) + views.shape[2:])
+
+        manifest = RenderManifest(tgt_dir)
+        parameter_hash = get_parameter_hash(LF)
+
+        # Pixel shift per meter of camera position for a focus distance, relative to the focus of the rig
+        f_px = LF.focal_length * max(views.shape[1:3]) / LF.sensor_size
+        rig_inverse_focus = 1. / LF.focus_dist if LF.focus_dist > 0 else 0.
+        table = LF.get_camera_table()
+
+        # Same focus distances and file names as the rendered stack
+        focus_distances = self.get_focus_distances(LF)
+
+        def synthesize(focus):
+            image_filename = 'focus_' + str(trunc(focus))
+            scale = f_px * (1. / focus - rig_inverse_focus)
+            image = shift_and_add(views, table[:, 1] * scale, -table[:, 0] * scale)
+            cv2.imwrite(os.path.join(tgt_dir, image_filename + '.png'), np.round(image).astype(np.uint8))
+            manifest.record(image_filename, get_entry_hash(parameter_hash, 'synthetic_focus', focus), None,
+                            [image_filename + '.png'])
+
+        # Slices are independent, numpy releases the GIL while shifting and adding the views
+        start = time.perf_counter()
+        num_workers = max(1, min(os.cpu_count() or 1, len(focus_distances)))
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            list(pool.map(synthesize, focus_distances))
+        print("Synthesized %d focus slice(s) from %d view(s) in %.3f s"
+              % (len(focus_distances), len(views), time.perf_counter() - start))
+        
+    
+    @staticmethod
+    def get_focus_distances(LF):
+        # Focus distance of each step, a rig focused at infinity renders all steps at 10000
+        if LF.focus_dist == 0:
+            return [10000] * LF.focus_steps  # not really infinity... but close enough.
+        return [LF.focus_dist + i * LF.focus_separation for i in range(0, LF.focus_steps)]
+
+    def create_output_node_focus(self):
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        Create the image output node of the focus stack
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        scene_key = bpy.context.scene.name
+        LF = bpy.context.scene.LF
 
         bpy.context.scene.use_nodes = True
         bpy.context.view_layer.use_pass_z = True
@@ -529,9 +764,6 @@ class OBJECT_OT_render_focus_stack(bpy.types.Operator):
                     bpy.context.scene.node_tree.nodes.remove(node)
         except KeyError:
             pass
-        
-        # Select center camera for rendering
-        LF.cycles_seed = random.randint(0, 2147483646 - 10 - 1)
 
         # Create image output node
         image_out_node = bpy.data.scenes[scene_key].node_tree.nodes.new(type='CompositorNodeOutputFile')
@@ -546,98 +778,48 @@ class OBJECT_OT_render_focus_stack(bpy.types.Operator):
         bpy.data.scenes[scene_key].node_tree.links.new(right, left)
 
         bpy.data.scenes[scene_key].render.filepath = os.path.join(bpy.path.abspath(LF.tgt_dir), "unused_blenderender_output")
-        image_out_node.base_path = tgt_dir
 
-        # Render view per camera
-        c_image = 'Image'
-        for cam_idx, camera in enumerate(cameras):
-            
-            print("Rendering scene with focus: " + str(bpy.context.object.data.dof.focus_distance))
-            image_filename = 'focus_' + str(trunc(camera.data.dof.focus_distance))
-            image_out_node.file_slots[c_image].path = image_filename + '_frame###'
-            c_image = image_filename + '_frame###'
+        return image_out_node
 
-            # Set scene camera to current light field camera
-            bpy.data.scenes[scene_key].camera = camera
-
-            # Change seed
-            bpy.data.scenes[scene_key].cycles.seed = LF.cycles_seed + cam_idx
-            print("Cycles seed for camera %d: %d" % (cam_idx, bpy.data.scenes[scene_key].cycles.seed))
-
-            # Render scene and adjust the file name
-            bpy.ops.render.render(write_still=True)
-            self.remove_blender_frame_from_file_name(image_filename, tgt_dir)
-            
-        # Remove the image output node and set focus value to original
-        bpy.context.scene.node_tree.nodes.remove(image_out_node)
-        
-        print('Done!')
-        
-    
-    def create_cameras_focus(self):
+    def create_camera_focus(self):
         """""""""""""""""""""""""""""""""""""""""""""""""""""""""""
-        Create the necessary cameras for the focus stack generation
+        Create the camera for the focus stack generation
         """""""""""""""""""""""""""""""""""""""""""""""""""""""""""
         LF = bpy.context.scene.LF
 
-        cameras = []
-        
-        # Obtain world matrices to extract position and rotation for the new cameras
-        camera_name = LF.get_center_camera().name
-        world_matrix = bpy.data.objects[camera_name].matrix_world
-        world_matrix_rotation = bpy.data.objects[camera_name].matrix_world.to_euler()
-        
-        # Generate the new cameras with varying focus
-        focus = LF.focus_dist
-        for i in range(0, LF.focus_steps):
-            cameras.append(self.create_camera_focus('focus_Cam' + str(trunc(focus)), focus, world_matrix, world_matrix_rotation))
-            focus = focus + LF.focus_separation
-
-        return cameras
+        camera_data = bpy.data.cameras.new('LF_focus_Cam')
+        camera = bpy.data.objects.new('LF_focus_Cam', camera_data)
+        bpy.context.scene.collection.objects.link(camera)
 
-    def create_camera_focus(self, cam_name, focus, world_matrix, world_matrix_rotation):
-        LF = bpy.context.scene.LF
-        bpy.ops.object.camera_add(location=(world_matrix[0][3], world_matrix[1][3], world_matrix[2][3]),
-                                  rotation=(world_matrix_rotation[0], world_matrix_rotation[1], world_matrix_rotation[2]))
-        
-        camera = bpy.context.active_object
-        camera.name = cam_name
         camera.data.display_size = 0.5
         camera.data.lens = LF.focal_length
         camera.data.sensor_width = LF.sensor_size
         camera.data.sensor_height = LF.sensor_size
         
-        # Activate the depth of field utility
-        bpy.context.object.data.dof.use_dof = True
-        
-        # Adjust the focus distance
-        if LF.focus_dist == 0:
-            factor = 0  # focused at infinity
-            bpy.context.object.data.dof.focus_distance = 10000  # not really infinity... but close enough.
-        else:
-            factor = LF.focal_length / LF.sensor_size / focus
-            bpy.context.object.data.dof.focus_distance = focus
-        
-        bpy.context.object.data.dof.aperture_fstop = LF.fstop
-        bpy.context.object.data.cycles.aperture_type = 'FSTOP'
-        bpy.context.object.data.cycles.aperture_fstop = LF.fstop
-        bpy.context.object.data.cycles.aperture_blades = LF.num_blades
-        bpy.context.object.data.cycles.aperture_rotation = LF.rotation
-        bpy.types.Camera.dof = LF.fstop
+        # Activate the depth of field utility, the focus distance is set for each step
+        camera.data.dof.use_dof = True
+        camera.data.dof.aperture_fstop = LF.fstop
+        camera.data.cycles.aperture_type = 'FSTOP'
+        camera.data.cycles.aperture_fstop = LF.fstop
+        camera.data.cycles.aperture_blades = LF.num_blades
+        camera.data.cycles.aperture_rotation = LF.rotation
 
         return camera
     
-    def delete_cameras_focus(self, cameras):
+    def delete_camera_focus(self, camera):
         """""""""""""""""""""""""""""""""""""""""""""
-        Delete existing cameras after focus rendering
+        Delete the camera after focus rendering
         """""""""""""""""""""""""""""""""""""""""""""
         LF = bpy.context.scene.LF
         scene_key = bpy.context.scene.name
-                
-                
-        for cam_idx, camera in enumerate(cameras):
-            camera.select_set(True)
-        bpy.ops.object.delete()
+
+        # Give the scene its center camera back
+        if bpy.data.scenes[scene_key].camera == camera:
+            bpy.data.scenes[scene_key].camera = LF.get_center_camera()
+
+        camera_data = camera.data
+        bpy.data.objects.remove(camera, do_unlink=True)
+        bpy.data.cameras.remove(camera_data)
         
         
     @staticmethod
@@ -668,6 +850,13 @@ class OBJECT_OT_render_lightfield(bpy.types.Operator):
     bl_label = """Render Light Field"""
     bl_options = {'REGISTER'}
 
+    # Set by the render farm: JSON list of [frame, first camera, last camera + 1] ranges
+    # to render in this process, and the seed shared by all of its workers
+    shard: StringProperty(default='', options={'HIDDEN', 'SKIP_SAVE'})
+    seed: IntProperty(default=-1, options={'HIDDEN', 'SKIP_SAVE'})
+    # Set by the render farm once its workers are done: only run the post-processing
+    skip_rendering: BoolProperty(default=False, options={'HIDDEN', 'SKIP_SAVE'})
+
     def execute(self, context):
         
         # INITIALIZE ATTRIBUTES
@@ -675,42 +864,46 @@ class OBJECT_OT_render_lightfield(bpy.types.Operator):
         
         LF = bpy.context.scene.LF
         
-        # Image attributes
-        self.image_list_lenslet = []
-        self.image_list_sbs1 = []
-        self.image_list_sbs2 = []
-        self.total_height = LF.x_res * LF.num_cams_x
-        self.total_width = LF.y_res * LF.num_cams_y
-        
+        # render farm worker mode
+        # only the given camera ranges are rendered, post-processing is left to the scheduler
+        if self.shard:
+            for frame, first_camera, last_camera in json.loads(self.shard):
+                bpy.context.scene.frame_current = frame
+                self.renderFrame(LF.get_frame_directory(frame), range(first_camera, last_camera), self.seed)
 
         # legacy mode
-        if LF.sequence_start == LF.sequence_end:
+        elif LF.sequence_start == LF.sequence_end:
             bpy.context.scene.frame_current = LF.sequence_start
-            self.renderFrame()
+            if not self.skip_rendering:
+                self.renderFrame()
             if LF.save_sidebyside_image == True:
                 self.getSideBySideImage(LF, LF.tgt_dir)
             if LF.save_lenslet_image == True:
                 self.getLensletImage(LF, LF.tgt_dir)
+            if LF.save_container == True:
+                self.getContainerFile(LF, LF.tgt_dir)
             
 
         # sequence mode
         # when more then one frame should be rendered we render each frame to a different folder
         else:
-            frame_list = range(LF.sequence_start, LF.sequence_end+1, LF.sequence_steps)
-            for i in frame_list:
+            for i in LF.get_sequence_frames():
                 bpy.context.scene.frame_current = i
-                tgt_dir = os.path.join(bpy.path.abspath(LF.tgt_dir),"sequence","{:06d}".format(i))
-                self.renderFrame(tgt_dir)
+                tgt_dir = LF.get_frame_directory(i)
+                if not self.skip_rendering:
+                    self.renderFrame(tgt_dir)
                 if LF.save_sidebyside_image == True:
-                    self.getSideBySideImage(LF, LF.tgt_dir)
+                    self.getSideBySideImage(LF, tgt_dir)
                 if LF.save_lenslet_image == True:
-                    self.getLensletImage(LF, LF.tgt_dir)
+                    self.getLensletImage(LF, tgt_dir)
+                if LF.save_container == True:
+                    self.getContainerFile(LF, tgt_dir)
 
 
         return {'FINISHED'}
         
     
-    def renderFrame(self, tgt_dir = None):
+    def renderFrame(self, tgt_dir = None, views = None, seed = None):
         """""""""""""""""""""""""""""""""""""""""""""""""""""""""
         Renders the currently selected frame to tgt_dir folder
         """""""""""""""""""""""""""""""""""""""""""""""""""""""""
@@ -735,51 +928,86 @@ class OBJECT_OT_render_lightfield(bpy.types.Operator):
         except KeyError:
             pass
 
-        lf_cameras = LF.get_lightfield_cameras()
-        LF.cycles_seed = random.randint(0, 2147483646 - len(lf_cameras) - 1)
-
-
-        # Check to see if light field views are already created
-        files = glob.glob(LF.tgt_dir + "/input_Cam*.png")
-        parser = configparser.ConfigParser(delimiters="=")
-        if len(files) > 0:
-            parser.readfp(open(LF.tgt_dir + '/parameters.cfg'))
-            reso_x = parser.get('intrinsics', 'image_resolution_x_px')
-            reso_y = parser.get('intrinsics', 'image_resolution_y_px')
-        
-        # Render input views with original resolution if not created
-        if len(files) == 0:
-            self.render_input_views(lf_cameras, scene_key, LF, tgt_dir)
-        if (len(files) >= 1) and ((str(LF.x_res) != reso_x) or (str(LF.y_res) != reso_y)):
-            self.render_input_views(lf_cameras, scene_key, LF, tgt_dir)
-            
+        # Views rendered by this call, a render farm worker only gets a part of the light field
+        lf_views = LF.get_camera_indices()
+        if views is None:
+            views = lf_views
+        center_view = LF.get_center_camera_index()
+
+        # Outputs already rendered with the same parameters and scene are skipped, so that an
+        # interrupted render resumes from the first missing output. Object ids are assigned first,
+        # they are part of the scene hash.
+        self.assign_object_ids()
+        self.scene_hash = get_scene_hash()
+        self.manifest = RenderManifest(tgt_dir)
+        self.parameter_hash = get_parameter_hash(LF, self.scene_hash)
+
+        # Decoded views of post-processing stages, dropped or replaced as their files are written
+        self.view_store = get_view_store(LF)
+
+        # Identical renders of earlier runs are reused from the render cache
+        self.cache = get_render_cache(LF)
+
+        # The seed of each view is offset by its camera index, so that it does not depend on the shard.
+        # A resumed render keeps the seed of the views rendered before.
+        if seed is None or seed < 0:
+            seed = self.manifest.get_base_seed()
+            if LF.render_seed >= 0:
+                seed = LF.render_seed
+        if seed is None:
+            seed = random.randint(0, 2147483646 - len(lf_views) - 1)
+        LF.cycles_seed = seed
+
+        # Depth and disparity files are written in the background while the next view is rendered
+        self.writer_pool = WriterPool()
+
+        # Views with high resolution object id and depth maps
+        if LF.save_object_id_maps_for_all_views:
+            oid_views = views
+        else:
+            oid_views = [idx for idx in views if idx == center_view]
+        if LF.save_depth_for_all_views:
+            depth_views = views
+        else:
+            depth_views = [idx for idx in views if idx == center_view]
 
         # Store current render status
         current_render_engine = bpy.context.scene.render.engine
-        
-        # Change settings for high resolution rendering
-        bpy.data.scenes[bpy.context.scene.name].render.resolution_percentage = int(100 * LF.depth_map_scale)
-        bpy.context.scene.render.engine = 'BLENDER_EEVEE'
 
-        # Render high resolution object id maps
-        if LF.save_object_id_maps_for_all_views:
-            oid_cameras = lf_cameras
-        else:
-            oid_cameras = [LF.get_center_camera()]
-        self.render_object_id_maps(oid_cameras, scene_key, LF, tgt_dir)
+        if LF.use_single_pass:
+            # Render image, object ids and depth of each view at once in high resolution
+            bpy.data.scenes[bpy.context.scene.name].render.resolution_percentage = int(100 * LF.depth_map_scale)
+            self.render_single_pass(views, oid_views, depth_views, scene_key, LF, tgt_dir)
 
-        # Render high resolution depth maps
-        if LF.save_depth_for_all_views:
-            depth_cameras = lf_cameras
         else:
-            depth_cameras = [LF.get_center_camera()]
-        self.render_depth_and_disp_maps(depth_cameras, scene_key, LF, tgt_dir)
+            # Render input views with original resolution
+            self.render_input_views(views, scene_key, LF, tgt_dir)
+
+            # Change settings for high resolution rendering
+            bpy.data.scenes[bpy.context.scene.name].render.resolution_percentage = int(100 * LF.depth_map_scale)
+            bpy.context.scene.render.engine = 'BLENDER_EEVEE'
+
+            # Render high resolution object id maps
+            if len(oid_views) > 0:
+                self.render_object_id_maps(oid_views, scene_key, LF, tgt_dir)
+
+            # Render high resolution depth maps
+            if len(depth_views) > 0:
+                self.render_depth_and_disp_maps(depth_views, scene_key, LF, tgt_dir)
+
+        # Wait for the remaining files, errors of the writer pool are raised here
+        try:
+            self.writer_pool.flush()
+        finally:
+            self.writer_pool.close()
 
         # Save parameters as config file in target directory of rendering
-        tmp_config_path = LF.path_config_file
-        LF.path_config_file = os.path.join(tgt_dir, 'parameters.cfg')
-        bpy.ops.scene.save_lightfield('EXEC_DEFAULT')
-        LF.path_config_file = tmp_config_path
+        # (on a render farm this is done by the worker rendering the center view)
+        if center_view in views:
+            tmp_config_path = LF.path_config_file
+            LF.path_config_file = os.path.join(tgt_dir, 'parameters.cfg')
+            bpy.ops.scene.save_lightfield('EXEC_DEFAULT')
+            LF.path_config_file = tmp_config_path
 
         # Reset status
         bpy.context.scene.render.engine = current_render_engine
@@ -789,7 +1017,7 @@ class OBJECT_OT_render_lightfield(bpy.types.Operator):
         print('Done!')
 
 
-    def render_input_views(self, cameras, scene_key, LF, tgt_dir):
+    def render_input_views(self, views, scene_key, LF, tgt_dir):
 
         # Create image output node
         image_out_node = bpy.data.scenes[scene_key].node_tree.nodes.new(type='CompositorNodeOutputFile')
@@ -809,9 +1037,24 @@ class OBJECT_OT_render_lightfield(bpy.types.Operator):
 
         # Render view per camera
         c_image = 'Image'
-        for cam_idx, camera in enumerate(cameras):
-            print("Rendering scene with camera: " + camera.name)
-            image_filename = 'input_' + self.get_raw_camera_name(camera.name)
+        for cam_idx, camera, camera_name in iter_views(LF, views):
+            image_filename = 'input_' + self.get_raw_camera_name(camera_name)
+            entry_hash = get_entry_hash(self.parameter_hash, 'view', cam_idx, LF.cycles_seed)
+            if self.manifest.is_valid(image_filename, entry_hash):
+                print("Skipping camera %s, already rendered" % camera_name)
+                continue
+
+            if self.cache is not None:
+                cache_key = get_render_key(self.scene_hash, camera, LF.cycles_seed + cam_idx, 'input')
+                if self.cache.fetch(cache_key, os.path.join(tgt_dir, image_filename + '.png')):
+                    print("Reusing cached render for camera %s" % camera_name)
+                    self.manifest.record(image_filename, entry_hash, LF.cycles_seed + cam_idx,
+                                         [image_filename + '.png'], base_seed=LF.cycles_seed)
+                    self.view_store.discard(tgt_dir, self.get_raw_camera_name(camera_name),
+                                            bpy.context.scene.frame_current, 'input')
+                    continue
+
+            print("Rendering scene with camera: " + camera_name)
             image_out_node.file_slots[c_image].path = image_filename + '_frame###'
             c_image = image_filename + '_frame###'
 
@@ -825,12 +1068,128 @@ class OBJECT_OT_render_lightfield(bpy.types.Operator):
             # render scene and adjust the file name
             bpy.ops.render.render(write_still=True)
             self.remove_blender_frame_from_file_name(image_filename, tgt_dir)
+            self.manifest.record(image_filename, entry_hash, bpy.data.scenes[scene_key].cycles.seed,
+                                 [image_filename + '.png'], base_seed=LF.cycles_seed)
+            self.view_store.discard(tgt_dir, self.get_raw_camera_name(camera_name),
+                                    bpy.context.scene.frame_current, 'input')
+            if self.cache is not None:
+                self.cache.store(cache_key, os.path.join(tgt_dir, image_filename + '.png'))
 
         # Remove the image output node
         bpy.context.scene.node_tree.nodes.remove(image_out_node)
 
 
-    def render_object_id_maps(self, cameras, scene_key, LF, tgt_dir):
+    def render_single_pass(self, views, oid_views, depth_views, scene_key, LF, tgt_dir):
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        Renders image, object ids and depth of each view with a
+        single high resolution render, the input view is obtained
+        by downsampling the high resolution image
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        import cv2
+
+        bpy.context.view_layer.use_pass_object_index = True
+        self.assign_object_ids()
+
+        # one file output node with a 16 bit image slot and an object id slot
+        out_node = bpy.data.scenes[scene_key].node_tree.nodes.new(type='CompositorNodeOutputFile')
+        out_node.format.file_format = 'PNG'
+        out_node.format.color_mode = 'RGB'
+        out_node.format.color_depth = '16'
+        out_node.name = 'LF_SINGLE_PASS_OUTPUT'
+        out_node.base_path = tgt_dir
+        out_node.file_slots.new('IndexOB')
+        image_slot = out_node.file_slots[0]
+        oid_slot = out_node.file_slots[1]
+        oid_slot.use_node_format = False
+        oid_slot.format.file_format = 'PNG'
+        oid_slot.format.color_depth = '16'
+        oid_slot.format.color_mode = 'BW'
+
+        right = bpy.data.scenes[scene_key].node_tree.nodes['Render Layers'].outputs['Image']
+        bpy.data.scenes[scene_key].node_tree.links.new(right, out_node.inputs[0])
+        self.link_object_ids(scene_key, out_node.inputs[1])
+        self.add_depth_viewer_node(scene_key)
+
+        bpy.data.scenes[scene_key].render.filepath = os.path.join(bpy.path.abspath(LF.tgt_dir), "unused_blenderender_output")
+
+        # Viewer Node pixels are read into one buffer reused for all views
+        pixel_buffer = None
+
+        center_view = LF.get_center_camera_index()
+        center_entry_hash = None
+        for cam_idx, camera, camera_name in iter_views(LF, views):
+            raw_camera_name = self.get_raw_camera_name(camera_name)
+            image_filename = 'input_' + raw_camera_name
+            highres_filename = 'input_highres_' + raw_camera_name
+            oid_filename = 'objectids_highres_' + raw_camera_name
+            depth_key = 'depth_' + raw_camera_name
+
+            # only missing outputs are saved, a view is rendered if any of them is missing
+            image_hash = get_entry_hash(self.parameter_hash, 'view', cam_idx, LF.cycles_seed)
+            oid_hash = self.get_oid_entry_hash(cam_idx, LF)
+            depth_hash = self.get_depth_entry_hash(cam_idx, LF)
+            save_image = not self.manifest.is_valid(image_filename, image_hash)
+            save_oid = cam_idx in oid_views and not self.manifest.is_valid(oid_filename, oid_hash)
+            save_depth = cam_idx in depth_views and not self.manifest.is_valid(depth_key, depth_hash)
+            if cam_idx in depth_views and not save_depth:
+                LF.min_disp = self.manifest.get(depth_key)['min_disp']
+                LF.max_disp = self.manifest.get(depth_key)['max_disp']
+            if not (save_image or save_oid or save_depth):
+                print("Skipping camera %s, already rendered" % camera_name)
+                continue
+
+            print("Rendering all passes with camera: " + camera_name)
+            image_slot.path = highres_filename + '_frame###'
+            oid_slot.path = oid_filename + '_frame###'
+
+            # set scene camera to current light field camera
+            bpy.data.scenes[scene_key].camera = camera
+
+            # change seed
+            bpy.data.scenes[scene_key].cycles.seed = LF.cycles_seed + cam_idx
+            print("Cycles seed for camera %d: %d" % (cam_idx, bpy.data.scenes[scene_key].cycles.seed))
+
+            # render scene and adjust the file names, an object id map that is already valid
+            # is kept and only the map Blender just wrote is dropped
+            bpy.ops.render.render(write_still=True)
+            self.remove_blender_frame_from_file_name(highres_filename, tgt_dir)
+            if save_oid:
+                self.remove_blender_frame_from_file_name(oid_filename, tgt_dir)
+            else:
+                os.remove(os.path.join(tgt_dir, "%s_frame%03d.png" % (oid_filename, bpy.context.scene.frame_current)))
+
+            # input view with original resolution, averaged over the high resolution pixels
+            highres_path = os.path.join(tgt_dir, highres_filename + '.png')
+            if save_image:
+                image = cv2.imread(highres_path, cv2.IMREAD_UNCHANGED)
+                image = cv2.resize(image, (LF.x_res, LF.y_res), interpolation=cv2.INTER_AREA)
+                image = np.round(image / 257.).astype(np.uint8)
+                cv2.imwrite(os.path.join(tgt_dir, image_filename + '.png'), image)
+                self.view_store.put(tgt_dir, raw_camera_name, bpy.context.scene.frame_current, 'input', image,
+                                    os.path.join(tgt_dir, image_filename + '.png'))
+                self.manifest.record(image_filename, image_hash, bpy.data.scenes[scene_key].cycles.seed,
+                                     [image_filename + '.png'], base_seed=LF.cycles_seed)
+            os.remove(highres_path)
+
+            # the center view map is renamed below, so it is recorded afterwards
+            if save_oid:
+                if cam_idx == center_view and not LF.save_object_id_maps_for_all_views:
+                    center_entry_hash = oid_hash
+                else:
+                    self.manifest.record(oid_filename, oid_hash, None, [oid_filename + '.png'])
+
+            if save_depth:
+                depth, pixel_buffer = self.read_viewer_depth(pixel_buffer, camera_name)
+                self.save_depth_and_disp_maps(depth, raw_camera_name, depth_key, depth_hash, LF, tgt_dir)
+
+        if len(oid_views) > 0:
+            self.save_center_object_id_map(views, LF, tgt_dir, center_entry_hash)
+
+        # remove the output node
+        bpy.context.scene.node_tree.nodes.remove(out_node)
+
+
+    def render_object_id_maps(self, views, scene_key, LF, tgt_dir):
         bpy.context.view_layer.use_pass_object_index = True
 
         # prepare nodes for object id map
@@ -840,6 +1199,50 @@ class OBJECT_OT_render_lightfield(bpy.types.Operator):
         oid_out_node.format.color_mode = 'BW'
         oid_out_node.name = 'LF_OID_OUTPUT'
 
+        self.link_object_ids(scene_key, oid_out_node.inputs['Image'])
+        oid_out_node.base_path = tgt_dir
+        out_oid = oid_out_node.file_slots['Image']
+
+        # assign an object id to all scene objects
+        self.assign_object_ids()
+
+        # save object id map for each camera
+        center_view = LF.get_center_camera_index()
+        center_entry_hash = None
+        for cam_idx, camera, camera_name in iter_views(LF, views):
+            oid_filename = 'objectids_highres_' + self.get_raw_camera_name(camera_name)
+            entry_hash = self.get_oid_entry_hash(cam_idx, LF)
+            if self.manifest.is_valid(oid_filename, entry_hash):
+                print("Skipping object id map of camera %s, already rendered" % camera_name)
+                continue
+
+            print("Rendering object id map with camera: " + camera_name)
+            out_oid.path = oid_filename + "_frame###"
+
+            oid_out_node.file_slots[0].path = oid_filename
+
+            # set scene camera to current light field camera
+            bpy.data.scenes[scene_key].camera = camera
+
+            # render scene and adjust the file name
+            bpy.ops.render.render(write_still=True)
+            self.remove_blender_frame_from_file_name(oid_filename, tgt_dir)
+
+            # the center view map is renamed below, so it is recorded afterwards
+            if cam_idx == center_view and not LF.save_object_id_maps_for_all_views:
+                center_entry_hash = entry_hash
+            else:
+                self.manifest.record(oid_filename, entry_hash, None, [oid_filename + '.png'])
+
+        self.save_center_object_id_map(views, LF, tgt_dir, center_entry_hash)
+
+        # remove the oid output node
+        bpy.context.scene.node_tree.nodes.remove(oid_out_node)
+
+
+    @staticmethod
+    def link_object_ids(scene_key, left):
+        # object ids are scaled to the 16 bit range of the png output
         oid_math_node = bpy.data.scenes[scene_key].node_tree.nodes.new(type='CompositorNodeMath')
         oid_math_node.operation = 'DIVIDE'
         oid_math_node.inputs[1].default_value = 2 ** 16 - 1
@@ -848,207 +1251,282 @@ class OBJECT_OT_render_lightfield(bpy.types.Operator):
         right = bpy.data.scenes[scene_key].node_tree.nodes['Render Layers'].outputs['IndexOB']
         math_left = oid_math_node.inputs[0]
         math_right = oid_math_node.outputs[0]
-        left = oid_out_node.inputs['Image']
 
         bpy.data.scenes[scene_key].node_tree.links.new(right, math_left)
         bpy.data.scenes[scene_key].node_tree.links.new(math_right, left)
-        oid_out_node.base_path = tgt_dir
-        out_oid = oid_out_node.file_slots['Image']
 
-        # assign an object id to all scene objects
+
+    @staticmethod
+    def assign_object_ids():
         idx = 1
         for obj in bpy.data.objects:
             if obj.type not in ['CAMERA', 'LAMP', 'EMPTY'] and not obj.name.startswith("LF"):
                 obj.pass_index = idx
                 idx += 1
 
-        # save object id map for each camera
-        for camera in cameras:
-            print("Rendering object id map with camera: " + camera.name)
-            oid_filename = 'objectids_highres_' + self.get_raw_camera_name(camera.name)
-            out_oid.path = oid_filename + "_frame###"
 
-            oid_out_node.file_slots[0].path = oid_filename
+    def get_oid_entry_hash(self, cam_idx, LF):
+        return get_entry_hash(self.parameter_hash, 'objectids', cam_idx, LF.depth_map_scale,
+                              LF.save_object_id_maps_for_all_views)
 
-            # set scene camera to current light field camera
-            bpy.data.scenes[scene_key].camera = camera
 
-            # render scene and adjust the file name
-            bpy.ops.render.render(write_still=True)
-            self.remove_blender_frame_from_file_name(oid_filename, tgt_dir)
+    def get_depth_entry_hash(self, cam_idx, LF):
+        return get_entry_hash(self.parameter_hash, 'depth', cam_idx, LF.depth_map_scale,
+                              LF.artefact_window_radius, LF.artefact_max_iterations, LF.save_depth_as_png, LF.save_depth_as_pfm, LF.save_depth_for_all_views)
+
 
+    def save_center_object_id_map(self, views, LF, tgt_dir, center_entry_hash):
         # handle additional "standard" center view object id map
+        center_view = LF.get_center_camera_index()
         center_camera = LF.get_center_camera()
         src = os.path.join(tgt_dir, 'objectids_highres_%s.png' % self.get_raw_camera_name(center_camera.name))
         tgt = os.path.join(tgt_dir, 'objectids_highres.png')
+        if center_view in views and os.path.exists(src) and (LF.save_object_id_maps_for_all_views or center_entry_hash):
+
+            # remove file with final filename if it exists
+            # (necessary for Windows systems where renaming is not an atomic operation)
+            try:
+                os.remove(tgt)
+            except:
+                pass
+
+            if LF.save_object_id_maps_for_all_views:
+                shutil.copy(src, tgt)
+            else:
+                os.rename(src, tgt)
+                self.manifest.record('objectids_highres_%s' % self.get_raw_camera_name(center_camera.name),
+                                     center_entry_hash, None, ['objectids_highres.png'])
+
+
+    def render_depth_and_disp_maps(self, views, scene_key, LF, tgt_dir):
+
+        # prepare depth output node
+        self.add_depth_viewer_node(scene_key)
+
+        # Viewer Node pixels are read into one buffer reused for all views
+        pixel_buffer = None
+
+        for cam_idx, camera, camera_name in iter_views(LF, views):
+            raw_camera_name = self.get_raw_camera_name(camera_name)
+            depth_key = 'depth_' + raw_camera_name
+            entry_hash = self.get_depth_entry_hash(cam_idx, LF)
+            if self.manifest.is_valid(depth_key, entry_hash):
+                print("Skipping depth map of camera %s, already rendered" % camera_name)
+                LF.min_disp = self.manifest.get(depth_key)['min_disp']
+                LF.max_disp = self.manifest.get(depth_key)['max_disp']
+                continue
 
-        # remove file with final filename if it exists
-        # (necessary for Windows systems where renaming is not an atomic operation)
-        try:
-            os.remove(tgt)
-        except:
-            pass
+            #print("Rendering depth map with camera: " + camera_name)
 
-        if LF.save_object_id_maps_for_all_views:
-            shutil.copy(src, tgt)
-        else:
-            os.rename(src, tgt)
+            # set scene camera to current light field camera
+            bpy.data.scenes[scene_key].camera = camera
 
-        # remove the oid output node
-        bpy.context.scene.node_tree.nodes.remove(oid_out_node)
+            # reuse the depth map of an identical render from the render cache
+            depth = None
+            if self.cache is not None:
+                cache_key = get_render_key(self.scene_hash, camera, None, 'depth')
+                depth = self.cache.load_array(cache_key)
 
+            if depth is None:
+                # render scene and extract depth map to numpy array
+                bpy.ops.render.render(write_still=True)
+                depth, pixel_buffer = self.read_viewer_depth(pixel_buffer, camera_name)
+                if self.cache is not None:
+                    self.cache.store_array(cache_key, depth)
+
+            self.save_depth_and_disp_maps(depth, raw_camera_name, depth_key, entry_hash, LF, tgt_dir)
 
-    def render_depth_and_disp_maps(self, cameras, scene_key, LF, tgt_dir):
-        import cv2
-        from PIL import Image
-        
-        max_res = max(LF.x_res, LF.y_res)
-        factor = LF.baseline_x_m * LF.focal_length * LF.focus_dist * max_res
 
-        # prepare depth output node. blender changed their naming convection for render layers in 2.79... so Z became Depth and everthing else got complicated ;)
+    @staticmethod
+    def add_depth_viewer_node(scene_key):
+        # blender changed their naming convection for render layers in 2.79... so Z became Depth and everthing else got complicated ;)
         if 'Z' in bpy.data.scenes[scene_key].node_tree.nodes['Render Layers'].outputs:
             right = bpy.data.scenes[scene_key].node_tree.nodes['Render Layers'].outputs['Z']
         else:
             right = bpy.data.scenes[scene_key].node_tree.nodes['Render Layers'].outputs['Depth']
-            
+
         depth_view_node = bpy.data.scenes[scene_key].node_tree.nodes.new('CompositorNodeViewer')
         depth_view_node.use_alpha = False
         left = depth_view_node.inputs[0]
         bpy.data.scenes[scene_key].node_tree.links.new(right, left)
+        return depth_view_node
 
-        for camera in cameras:
-            #print("Rendering depth map with camera: " + camera.name)
 
-            # set scene camera to current light field camera
-            bpy.data.scenes[scene_key].camera = camera
+    @staticmethod
+    def read_viewer_depth(pixel_buffer, camera_name):
+        # Returns the depth map of the Viewer Node and the pixel buffer for the next call. The buffer
+        # is reallocated if the size of the Viewer image changed, Blender rounds the render size
+        # (resolution * percentage / 100) down, so it may differ from y_res/x_res * depth_map_scale.
+        start = time.perf_counter()
+        viewer = bpy.data.images['Viewer Node']
+        depth_width, depth_height = viewer.size
+        if pixel_buffer is None or len(pixel_buffer) != depth_height * depth_width * 4:
+            pixel_buffer = np.empty(depth_height * depth_width * 4, dtype=np.float32)
+        viewer.pixels.foreach_get(pixel_buffer)  # size is width * height * 4 (rgba)
+
+        # depth is the first channel, the disparity is computed in double precision
+        depth = pixel_buffer[::4].reshape((depth_height, depth_width)).astype(np.float64)
+        print("Read back depth map of camera %s in %.3f s" % (camera_name, time.perf_counter() - start))
+        return depth, pixel_buffer
+
+
+    def save_depth_and_disp_maps(self, depth, raw_camera_name, depth_key, entry_hash, LF, tgt_dir):
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        Saves depth and disparity maps in high and low resolution
+        from a high resolution depth map. The files are written by
+        the writer pool while the next view is rendered.
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        max_res = max(LF.x_res, LF.y_res)
+        factor = LF.baseline_x_m * LF.focal_length * LF.focus_dist * max_res
 
-            # render scene and extract depth map to numpy array
-            bpy.ops.render.render(write_still=True)
-            pixels = bpy.data.images['Viewer Node'].pixels  # size is width * height * 4 (rgba)
-            depth = np.array(pixels)[::4]
+        def get_disp(depth):
+            return (factor / depth - LF.baseline_x_m * LF.focal_length * max_res) / LF.focus_dist / LF.sensor_size
+
+        # create depth and disparity maps with original (low) resolution, both in one batch
+        disp = get_disp(depth)
+        depth_small, disp_small = median_downsampling(np.stack((depth, disp)), LF.depth_map_scale, LF.depth_map_scale)
+
+        # check if high resolution depth map has depth artifacts on individual pixels
+        min_depth = np.min(depth_small)
+        max_depth = np.max(depth_small)
+        m_out_of_range = (depth < 0.9*min_depth) + (depth > 1.1*max_depth)
+
+        # the disparity map is computed again from the fixed depth map
+        if np.sum(m_out_of_range) > 0:
+            depth = fix_pixel_artefacts(depth, m_out_of_range, LF.artefact_window_radius, LF.artefact_max_iterations)
+            disp = get_disp(depth)
+            depth_small, disp_small = median_downsampling(np.stack((depth, disp)), LF.depth_map_scale, LF.depth_map_scale)
+
+        # Set disparity range for config file
+        LF.min_disp = np.floor(np.amin(disp_small) * 10) / 10 - 0.1
+        LF.max_disp = np.ceil(np.amax(disp_small) * 10) / 10 + 0.1
+        min_depth = np.floor(np.amin(depth_small) * 10) / 10 - 0.1
+        max_depth = np.ceil(np.amax(depth_small) * 10) / 10 + 0.1
+
+        # Save depth and disparity files as png/pfm
+        if LF.save_depth_for_all_views == True:
+            suffix = '_' + raw_camera_name
+        else:
+            suffix = ''
 
-            # reshape high resolution depth map
-            depth = depth.reshape((int(LF.y_res * LF.depth_map_scale), int(LF.x_res * LF.depth_map_scale)))
+        # previous maps are dropped from the view store, the new pfm map is added once it is written
+        frame = bpy.context.scene.frame_current
+        self.view_store.discard(tgt_dir, raw_camera_name, frame, 'disp_png')
+        self.view_store.discard(tgt_dir, raw_camera_name, frame, 'disp')
 
-            # create depth map with original (low) resolution
-            depth_small = median_downsampling(depth, LF.depth_map_scale, LF.depth_map_scale)
+        self.writer_pool.submit(write_depth_and_disp_maps, self.manifest, self.view_store, frame, raw_camera_name,
+                                depth_key, entry_hash, tgt_dir, suffix,
+                                depth, disp, depth_small, disp_small, min_depth, max_depth, LF.min_disp, LF.max_disp,
+                                LF.save_depth_as_pfm, LF.save_depth_as_png)
+                
 
-            # check if high resolution depth map has depth artifacts on individual pixels
-            min_depth = np.min(depth_small)
-            max_depth = np.max(depth_small)
-            m_out_of_range = (depth < 0.9*min_depth) + (depth > 1.1*max_depth)
+    def getLensletImage(self, LF, tgt_dir):
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        Saves lenslet image of the obtained rendered perspectives
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        
+        import cv2
+        import tempfile
 
-            if np.sum(m_out_of_range) > 0:
-                depth = self.fix_pixel_artefacts(depth, m_out_of_range)
-                depth_small = median_downsampling(depth, LF.depth_map_scale, LF.depth_map_scale)
+        tgt_dir = bpy.path.abspath(tgt_dir)
+        num_views_v = LF.num_cams_y
+        num_views_u = LF.num_cams_x
 
-            # Create disparity maps
-            disp = (factor / depth - LF.baseline_x_m * LF.focal_length * max_res) / LF.focus_dist / LF.sensor_size
-            disp_small = median_downsampling(disp, LF.depth_map_scale, LF.depth_map_scale)
+        # Decode the perspectives in parallel straight into their pixels of a disk backed lenslet
+        # image, so that big grids never need the decoded views or the lenslet image in memory
+        with tempfile.TemporaryFile(dir=tgt_dir) as lenslet_file:
+            lenslet = []
 
-            # Set disparity range for config file
-            LF.min_disp = np.floor(np.amin(disp_small) * 10) / 10 - 0.1
-            LF.max_disp = np.ceil(np.amax(disp_small) * 10) / 10 + 0.1
-            min_depth = np.floor(np.amin(depth_small) * 10) / 10 - 0.1
-            max_depth = np.ceil(np.amax(depth_small) * 10) / 10 + 0.1
-            
-            # Conversion from pfm to png
-            MIN = 0.
-            MAX = 255.
-            disp_png_high = (MAX - MIN) * (disp - LF.min_disp) / (LF.max_disp - LF.min_disp) + MIN
-            disp_png_low = (MAX - MIN) * (disp_small - LF.min_disp) / (LF.max_disp - LF.min_disp) + MIN
-            depth_png_high = (MAX - MIN) * (depth - min_depth) / (max_depth - min_depth) + MIN
-            depth_png_low = (MAX - MIN) * (depth_small - min_depth) / (max_depth - min_depth) + MIN
-            
-            # Flip array to obtain the correct depth map
-            disp_png_high = np.flipud(disp_png_high)
-            disp_png_low = np.flipud(disp_png_low)
-            depth_png_high = np.flipud(depth_png_high)
-            depth_png_low = np.flipud(depth_png_low)
-
-     
-            # Save depth and disparity files as png/pfm
-            if LF.save_depth_as_pfm == True and LF.save_depth_for_all_views == False:
-                write_pfm(depth, os.path.join(tgt_dir, 'gt_depth_highres.pfm'))
-                write_pfm(disp, os.path.join(tgt_dir, 'gt_disp_highres.pfm'))
-                write_pfm(depth_small, os.path.join(tgt_dir, 'gt_depth_lowres.pfm'))
-                write_pfm(disp_small, os.path.join(tgt_dir, 'gt_disp_lowres.pfm'))
-                
-            if LF.save_depth_as_png == True and LF.save_depth_for_all_views == False:
-                cv2.imwrite(os.path.join(tgt_dir, 'gt_depth_highres.png'), depth_png_high)
-                cv2.imwrite(os.path.join(tgt_dir, 'gt_disp_highres.png'), disp_png_high)
-                cv2.imwrite(os.path.join(tgt_dir, 'gt_depth_lowres.png'), depth_png_low)
-                cv2.imwrite(os.path.join(tgt_dir, 'gt_disp_lowres.png'), disp_png_low)
-
-            if LF.save_depth_as_pfm == True and LF.save_depth_for_all_views == True:
-                camera_name = self.get_raw_camera_name(camera.name)
-                write_pfm(depth, os.path.join(tgt_dir, 'gt_depth_highres_%s.pfm' % camera_name))
-                write_pfm(disp, os.path.join(tgt_dir, 'gt_disp_highres_%s.pfm' % camera_name))
-                write_pfm(depth_small, os.path.join(tgt_dir, 'gt_depth_lowres_%s.pfm' % camera_name))
-                write_pfm(disp_small, os.path.join(tgt_dir, 'gt_disp_lowres_%s.pfm' % camera_name))
-            
-            if LF.save_depth_as_png == True and LF.save_depth_for_all_views == True:
-                camera_name = self.get_raw_camera_name(camera.name)
-                cv2.imwrite(os.path.join(tgt_dir, 'gt_depth_highres_%s.png' % camera_name), depth_png_high)
-                cv2.imwrite(os.path.join(tgt_dir, 'gt_disp_highres_%s.png' % camera_name), disp_png_high)
-                cv2.imwrite(os.path.join(tgt_dir, 'gt_depth_lowres_%s.png' % camera_name), depth_png_low)
-                cv2.imwrite(os.path.join(tgt_dir, 'gt_disp_lowres_%s.png' % camera_name), disp_png_low)
-                
-
-    def fix_pixel_artefacts(self, disp, m_out_of_range, half_window=1):
-        print("Fixing %d out of range pixel(s), values: %s" % (np.sum(m_out_of_range), list(disp[m_out_of_range])))
-        coords = np.where(m_out_of_range)
-        h, w = np.shape(disp)
+            def allocate(shape, dtype):
+                height, width, channels = shape[2:]
+                lenslet.append(np.memmap(lenslet_file, dtype=dtype, mode='w+',
+                                         shape=(height * num_views_v, width * num_views_u, channels)))
+                return lenslet_views(lenslet[0], num_views_v, num_views_u)
 
-        for x, y in zip(coords[1], coords[0]):
-            xmin = max(0, x - half_window)
-            xmax = min(w - 1, x + half_window)
-            ymin = max(0, y - half_window)
-            ymax = min(h - 1, y + half_window)
+            views = load_view_grid(LF, tgt_dir, allocate)
+            if views is None:
+                print("Could not read the views for the lenslet image.")
+                return
+            del views
+            lenslet_im = lenslet.pop()
 
-            window_values = disp[ymin:ymax + 1, xmin:xmax + 1]
-            valid_window_values = window_values[~m_out_of_range[ymin:ymax + 1, xmin:xmax + 1]]
-            n_values = np.size(valid_window_values)
+            # Save image as a png into the path
+            cv2.imwrite(os.path.join(tgt_dir, 'lenslet.png'), lenslet_im)
+            del lenslet_im
 
-            if n_values == 0:
-                print("Could not find any pixels for inpainting depth artifact at (%d, %d)." % (y, x))
-                continue
 
-            # compute median (without averaging for even n)
-            median = np.sort(valid_window_values)[n_values / 2]
-            disp[y, x] = median
-
-        return disp
-    
-    
-    def getLensletImage(self, LF, tgt_dir):
+    def getContainerFile(self, LF, tgt_dir):
         """""""""""""""""""""""""""""""""""""""""""""""""""""""""
-        Saves lenslet image of the obtained rendered perspectives
+        Saves the rendered perspectives, depth, disparity and
+        object id maps as one memory mappable container file
         """""""""""""""""""""""""""""""""""""""""""""""""""""""""
-        
+
         import cv2
-        # Sort images in path. Read them and append them to the list of images
-        sorted_files = sorted(glob.glob(LF.tgt_dir + "/input_Cam*.png"))
-        for filename in sorted_files:
-            img = cv2.imread(filename)
-            self.image_list_lenslet.append(img)   
-            
-        # Create new empty lenslet image
-        lenslet_im = np.zeros((self.total_height, self.total_width, 3), dtype=np.uint8)
-        
-        # Save perspective values into lenslet image
-        idx = 0
-        for u in range(0, LF.num_cams_x):
-            for v in range(0, LF.num_cams_y):
-                im = self.image_list_lenslet[idx]
-                for ii in range(0, LF.x_res):
-                    for jj in range(0, LF.y_res):
-                        lenslet_im[(ii * LF.num_cams_x) + u, (jj * LF.num_cams_y) + v] = im[ii, jj]
-                idx += 1
-        
-        # Save image as a png into the path
-        cv2.imwrite(os.path.join(LF.tgt_dir, 'lenslet.png'), lenslet_im)
-        
+
+        tgt_dir = bpy.path.abspath(tgt_dir)
+        center_view = LF.get_center_camera_index()
+        parser = OBJECT_OT_save_lightfield.get_parser(LF)
+        parameters = {section: dict(parser.items(section)) for section in parser.sections()}
+
+        # Maps of all views have the camera name as suffix, otherwise only the center view has a map
+        def get_map_files(all_views, filename, suffix_filename):
+            if all_views:
+                views = LF.get_camera_indices()
+                return views, [os.path.join(tgt_dir, suffix_filename % ('Cam%3.3i' % idx)) for idx in views]
+            return [center_view], [os.path.join(tgt_dir, filename)]
+
+        maps = {}
+        if LF.save_depth_as_pfm:
+            maps['depth'] = get_map_files(LF.save_depth_for_all_views, 'gt_depth_lowres.pfm', 'gt_depth_lowres_%s.pfm')
+            maps['disp'] = get_map_files(LF.save_depth_for_all_views, 'gt_disp_lowres.pfm', 'gt_disp_lowres_%s.pfm')
+        maps['object_ids'] = get_map_files(LF.save_object_id_maps_for_all_views, 'objectids_highres.png',
+                                           'objectids_highres_%s.png')
+        for name, (map_views, paths) in list(maps.items()):
+            if not all(os.path.exists(path) for path in paths):
+                print("Leaving %s out of the light field container, not all maps were saved." % name)
+                del maps[name]
+
+        def read_map(path):
+            if path.endswith('.pfm'):
+                return read_pfm(path)
+            return cv2.imread(path, cv2.IMREAD_UNCHANGED)
+
+        # The container is written to a temporary file and replaces the previous one once complete
+        path = os.path.join(tgt_dir, 'lightfield.lfc')
+        tmp_path = path + '.tmp'
+        container = None
+
+        def create_container(shape, dtype):
+            nonlocal container
+            arrays = {'rgb': {'shape': shape, 'dtype': dtype}}
+            for name, (map_views, paths) in maps.items():
+                first_map = read_map(paths[0])
+                arrays[name] = {'shape': (len(map_views),) + first_map.shape,
+                                'dtype': first_map.dtype.newbyteorder('<'), 'views': list(map_views)}
+            container = LightFieldContainer.create(tmp_path, parameters, arrays)
+            return container['rgb']
+
+        # Perspectives are decoded straight into the container
+        views = load_view_grid(LF, tgt_dir, create_container)
+        if views is None:
+            print("Could not read the views for the light field container.")
+            if container is not None:
+                container.close()
+                os.remove(tmp_path)
+            return
+
+        # OpenCV decodes BGR
+        for v in range(0, views.shape[0]):
+            views[v] = views[v, ..., ::-1]
+
+        for name, (map_views, paths) in maps.items():
+            for idx, data in enumerate(iter_decoded(read_map, paths, LF.decode_workers)):
+                container[name][idx] = data
+
+        container.close()
+        os.replace(tmp_path, path)
+        print("Saved light field container '%s'" % path)
+
         
     def getSideBySideImage(self, LF, tgt_dir):
         """""""""""""""""""""""""""""""""""""""""""""""""""""""""
@@ -1056,35 +1534,32 @@ class OBJECT_OT_render_lightfield(bpy.types.Operator):
         """""""""""""""""""""""""""""""""""""""""""""""""""""""""
         
         import cv2
-        # Read images, disparity map and center perspective
+        # Read center perspective and its disparity map
+        tgt_dir = bpy.path.abspath(tgt_dir)
+        frame = bpy.context.scene.frame_current
+        view_store = get_view_store(LF)
         camera_name = self.get_raw_camera_name(LF.get_center_camera().name)
-        
-        file1 = sorted(glob.glob(LF.tgt_dir + "/input_%s*.png" % camera_name))
-        # For depth map of only one view
-        file2 = sorted(glob.glob(LF.tgt_dir + '/gt_disp_lowres.png'))
-        # For depth map of multiple views
-        file3 = sorted(glob.glob(LF.tgt_dir + '/gt_disp_lowres_%s.png' % camera_name))
-        for filename in file1:
-            img = cv2.imread(filename)
-            self.image_list_sbs1.append(img)
-        if len(file2) > 0:
-            for filename2 in file2:
-                img = cv2.imread(filename2)
-                self.image_list_sbs2.append(img)
-        elif len(file3) > 0:
-            for filename2 in file3:
-                img = cv2.imread(filename2)
-                self.image_list_sbs2.append(img)
-        
+
+        image = view_store.get(tgt_dir, camera_name, frame, 'input',
+                               os.path.join(tgt_dir, 'input_%s.png' % camera_name))
+        # For depth map of only one view or of multiple views
+        disp_paths = [os.path.join(tgt_dir, 'gt_disp_lowres.png'),
+                      os.path.join(tgt_dir, 'gt_disp_lowres_%s.png' % camera_name)]
+        disp_paths = [path for path in disp_paths if os.path.exists(path)]
+        if image is None or len(disp_paths) == 0:
+            print("Could not read the center view and its disparity map for the side-by-side image.")
+            return
+        disp = view_store.get(tgt_dir, camera_name, frame, 'disp_png', disp_paths[0])
+
         # Create new empty side-by-side image
-        sbs_im = np.zeros((LF.x_res, LF.y_res * 2, 3), dtype=np.uint8)
+        sbs_im = np.zeros((LF.y_res, LF.x_res * 2, 3), dtype=np.uint8)
         
         # Add the values to the image
-        sbs_im[:, 0:LF.y_res] = self.image_list_sbs1[0]
-        sbs_im[:, LF.y_res:LF.y_res * 2] = self.image_list_sbs2[0]
+        sbs_im[:, 0:LF.x_res] = image
+        sbs_im[:, LF.x_res:LF.x_res * 2] = disp
         
         # Save image as a png into the path
-        cv2.imwrite(os.path.join(LF.tgt_dir, 'side-by-side.png'), sbs_im)
+        cv2.imwrite(os.path.join(tgt_dir, 'side-by-side.png'), sbs_im)
         
         
 
@@ -1115,41 +1590,177 @@ class OBJECT_OT_render_lightfield(bpy.types.Operator):
         os.rename(blender_filename, final_filename)
 
 
-def write_pfm(data, fpath):
-    with open(fpath, 'wb') as file:
-        # header
-        height, width = np.shape(data)
-        file.write('Pf\n'.encode('utf-8'))
-        file.write(('%d %d\n' % (width, height)).encode('utf-8'))
-        file.write(('%d\n' % -1).encode('utf-8'))
+def write_depth_and_disp_maps(manifest, view_store, frame, camera_name, depth_key, entry_hash, tgt_dir, suffix,
+                              depth, disp, depth_small, disp_small, min_depth, max_depth, min_disp, max_disp,
+                              save_pfm, save_png):
+    # Writes the depth and disparity maps of one view and records them in the manifest once all
+    # files are complete. The low resolution disparity map is put into the view store as read from
+    # the pfm file. Runs on a writer pool thread, so it must not access Blender data.
+    import cv2
+
+    files = []
+    if save_pfm == True:
+        files += ['gt_depth_highres%s.pfm' % suffix, 'gt_disp_highres%s.pfm' % suffix,
+                  'gt_depth_lowres%s.pfm' % suffix, 'gt_disp_lowres%s.pfm' % suffix]
+        # the maps are bottom-up like the Blender pixel buffer
+        write_pfm(np.flipud(depth), os.path.join(tgt_dir, files[-4]))
+        write_pfm(np.flipud(disp), os.path.join(tgt_dir, files[-3]))
+        write_pfm(np.flipud(depth_small), os.path.join(tgt_dir, files[-2]))
+        write_pfm(np.flipud(disp_small), os.path.join(tgt_dir, files[-1]))
+        view_store.put(tgt_dir, camera_name, frame, 'disp', np.flipud(disp_small).astype(np.float32),
+                       os.path.join(tgt_dir, files[-1]))
+
+    if save_png == True:
+        # Conversion from pfm to png
+        MIN = 0.
+        MAX = 255.
+        disp_png_high = (MAX - MIN) * (disp - min_disp) / (max_disp - min_disp) + MIN
+        disp_png_low = (MAX - MIN) * (disp_small - min_disp) / (max_disp - min_disp) + MIN
+        depth_png_high = (MAX - MIN) * (depth - min_depth) / (max_depth - min_depth) + MIN
+        depth_png_low = (MAX - MIN) * (depth_small - min_depth) / (max_depth - min_depth) + MIN
+
+        # Flip array to obtain the correct depth map
+        files += ['gt_depth_highres%s.png' % suffix, 'gt_disp_highres%s.png' % suffix,
+                  'gt_depth_lowres%s.png' % suffix, 'gt_disp_lowres%s.png' % suffix]
+        cv2.imwrite(os.path.join(tgt_dir, files[-4]), np.flipud(depth_png_high))
+        cv2.imwrite(os.path.join(tgt_dir, files[-3]), np.flipud(disp_png_high))
+        cv2.imwrite(os.path.join(tgt_dir, files[-2]), np.flipud(depth_png_low))
+        cv2.imwrite(os.path.join(tgt_dir, files[-1]), np.flipud(disp_png_low))
+
+    manifest.record(depth_key, entry_hash, None, files, min_disp=min_disp, max_disp=max_disp)
+
+
+def get_rig_state(LF):
+    # Values of the properties the rig objects are built from
+    return {name: getattr(LF, name) for name in RIG_PROPERTIES}
+
+
+def shift_and_add(views, offsets_y, offsets_x):
+    # Mean of the (n, y, x, c) views, each sampled at (y + offsets_y[n], x + offsets_x[n]) with
+    # bilinear interpolation. Pixels are averaged over the views covering them only.
+    num_views, height, width, channels = views.shape
+    image = np.zeros((height, width, channels), dtype=np.float32)
+    weights = np.zeros((height, width, 1), dtype=np.float32)
+
+    for view, offset_y, offset_x in zip(views, offsets_y, offsets_x):
+        y0, x0 = int(np.floor(offset_y)), int(np.floor(offset_x))
+        fy, fx = offset_y - y0, offset_x - x0
+        for dy, weight_y in ((y0, 1 - fy), (y0 + 1, fy)):
+            for dx, weight_x in ((x0, 1 - fx), (x0 + 1, fx)):
+                weight = np.float32(weight_y * weight_x)
+                # output pixels whose sample lies inside the view
+                y_start, y_end = max(0, -dy), min(height, height - dy)
+                x_start, x_end = max(0, -dx), min(width, width - dx)
+                if weight == 0 or y_start >= y_end or x_start >= x_end:
+                    continue
+                image[y_start:y_end, x_start:x_end] += weight * view[y_start + dy:y_end + dy, x_start + dx:x_end + dx]
+                weights[y_start:y_end, x_start:x_end] += weight
+
+    return image / np.maximum(weights, np.float32(1e-6))
+
+
+def iter_views(LF, indices):
+    # Yields (camera index, camera object, camera name) for the given views. With a virtual rig
+    # the single rig camera is moved to every view in turn and put back to the center afterwards.
+    if not LF.use_virtual_rig:
+        for idx in indices:
+            camera_name = LF.get_camera_name_by_index(idx)
+            yield idx, bpy.data.objects[camera_name], camera_name
+        return
+
+    camera = LF.get_center_camera()
+    table = LF.get_camera_table()
+    try:
+        for idx in indices:
+            pos_x, pos_y, shift_x, shift_y = table[idx]
+            camera.location = (pos_x, pos_y, 0)
+            camera.data.shift_x = shift_x
+            camera.data.shift_y = shift_y
+            yield idx, camera, LF.get_camera_name_by_index(idx)
+    finally:
+        pos_x, pos_y, shift_x, shift_y = table[LF.get_center_camera_index()]
+        camera.location = (pos_x, pos_y, 0)
+        camera.data.shift_x = shift_x
+        camera.data.shift_y = shift_y
+
+
+def lenslet_interleave(views):
+    # (v, u, y, x, c) views -> lenslet image where pixel (y, x) holds a v x u block of the views
+    num_views_v, num_views_u, height, width, channels = np.shape(views)
+    lenslet = np.transpose(views, (2, 0, 3, 1, 4))
+    return lenslet.reshape(height * num_views_v, width * num_views_u, channels)
+
+
+def lenslet_views(lenslet, num_views_v, num_views_u):
+    # Inverse of lenslet_interleave as a (v, u, y, x, c) view of the lenslet image, writing a
+    # perspective into it writes its pixels into the lenslet image without an intermediate copy
+    height, width = np.shape(lenslet)[0] // num_views_v, np.shape(lenslet)[1] // num_views_u
+    views = np.reshape(lenslet, (height, num_views_v, width, num_views_u, -1))
+    return np.transpose(views, (1, 3, 0, 2, 4))
+
+
+def fix_pixel_artefacts(img, m_out_of_range, half_window=1, max_iterations=10):
+    # Replaces the masked pixels of img in place by the median of the valid pixels in their
+    # (2 * half_window + 1)^2 window, element N/2 of the sorted values as in median_downsampling.
+    # Pixels without any valid neighbour are filled in later iterations from the pixels repaired
+    # before, so holes up to max_iterations * half_window pixels wide are closed.
+    h, w = np.shape(img)
+    m_invalid = np.array(m_out_of_range, dtype=bool)
+    print("Fixing %d out of range pixel(s)" % np.count_nonzero(m_invalid))
+
+    offsets = [(dy, dx) for dy in range(-half_window, half_window + 1) for dx in range(-half_window, half_window + 1)]
+    for iteration in range(0, max_iterations):
+        ys, xs = np.nonzero(m_invalid)
+        if len(ys) == 0:
+            break
+
+        # window values of all masked pixels, invalid and outside values are sorted to the end
+        window_values = np.full((len(ys), len(offsets)), np.inf, dtype=img.dtype)
+        n_values = np.zeros(len(ys), dtype=np.intp)
+        for offset_idx, (dy, dx) in enumerate(offsets):
+            window_ys = np.clip(ys + dy, 0, h - 1)
+            window_xs = np.clip(xs + dx, 0, w - 1)
+            m_valid = ((ys + dy >= 0) & (ys + dy < h) & (xs + dx >= 0) & (xs + dx < w)
+                       & ~m_invalid[window_ys, window_xs])
+            window_values[m_valid, offset_idx] = img[window_ys[m_valid], window_xs[m_valid]]
+            n_values += m_valid
+
+        window_values.sort(axis=1)
+        m_fixed = n_values > 0
+        img[ys[m_fixed], xs[m_fixed]] = window_values[m_fixed, n_values[m_fixed] // 2]
+        m_invalid[ys[m_fixed], xs[m_fixed]] = False
+
+        if not np.any(m_fixed):
+            break
+
+    n_remaining = np.count_nonzero(m_invalid)
+    if n_remaining > 0:
+        print("Could not find any pixels for inpainting %d depth artifact(s)." % n_remaining)
+
+    return img
 
-        # data
-        values = np.ndarray.flatten(np.asarray(data, dtype=np.float32))
-        file.write(values)
-        
 
 def median_downsampling(img, tile_height, tile_width):
-    h, w = np.shape(img)
+    # Median of every tile_height x tile_width tile without averaging for even N, i.e. element N/2 of
+    # the sorted tile. Leading axes of img are a batch of maps, e.g. np.stack((depth, disp)).
+    img = np.asarray(img)
+    tile_height = int(tile_height)
+    tile_width = int(tile_width)
+    h, w = np.shape(img)[-2:]
     if w % tile_width or h % tile_height:
         raise Exception("Image dimensions must be multiple of tile dimensions.")
 
-    n_tiles_horiz = w / tile_width
-    n_tiles_vert = h / tile_height
-    n_tiles = n_tiles_horiz * n_tiles_vert
-
-    # split vertically into tiles with height=tile_height, width=img_width
-    tiles_vert = np.asarray(np.split(img, int(n_tiles_vert), 0))  # n_tiles_vert x tile_height x w
-    tiles_vert = tiles_vert.transpose([1, 0, 2]).reshape(int(tile_height), int(n_tiles_vert * w))
-
-    # split horizontally into tiles with height=tile_height, width=tile_width
-    tiles = np.asarray(np.split(tiles_vert, n_tiles, 1))
-    tiles = tiles.reshape(int(n_tiles), int(tile_width * tile_height))  # n_tiles x px_per_tile
+    n_tiles_vert = h // tile_height
+    n_tiles_horiz = w // tile_width
+    batch_shape = np.shape(img)[:-2]
 
-    # compute median per tile (without averaging for even N)
-    tiles = np.sort(tiles, axis=1)[:, int(tile_width*tile_height/2)]
-    small_img = tiles.reshape(int(n_tiles_vert), int(n_tiles_horiz))
+    # (..., n_tiles_vert, tile_height, n_tiles_horiz, tile_width) view, gathered to one row per tile
+    tiles = img.reshape(batch_shape + (n_tiles_vert, tile_height, n_tiles_horiz, tile_width))
+    tiles = np.swapaxes(tiles, -3, -2).reshape(batch_shape + (n_tiles_vert, n_tiles_horiz, tile_height * tile_width))
 
-    return small_img
+    # select the median instead of sorting the whole tile
+    median_idx = tile_height * tile_width // 2
+    return np.partition(tiles, median_idx, axis=-1)[..., median_idx]
 
 
 classes = (
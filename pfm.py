@@ -0,0 +1,67 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+# Portable float map (PFM) files.
+#
+# Orientation: arrays passed to write_pfm and returned by read_pfm are top-down, i.e. row 0 is
+# the top row of the image as in PNG files read with OpenCV. PFM stores the bottom row first,
+# so Blender pixel buffers, which are bottom-up as well, are passed as np.flipud(buffer).
+
+import numpy as np
+
+
+def read_pfm(path, mmap=True):
+    # Reads a grayscale (h, w) or color (h, w, 3) PFM file. The returned array is a read-only,
+    # top-down view of the memory mapped file (or of the file contents with mmap=False), so no
+    # values are copied unless the file stores a scale other than 1.
+    with open(path, 'rb') as pfm_file:
+        identifier, size, scale_endianess = (pfm_file.readline().decode('latin-1').strip() for _ in range(3))
+        offset = pfm_file.tell()
+
+        if identifier not in ('PF', 'Pf'):
+            raise ValueError("Not a PFM file: '%s'" % path)
+        channels = 3 if identifier == 'PF' else 1
+        width, height = (int(value) for value in size.split())
+        scale_endianess = float(scale_endianess)
+
+        dtype = '>f4' if scale_endianess > 0 else '<f4'
+        shape = (height, width, 3) if channels == 3 else (height, width)
+        if mmap:
+            data = np.memmap(pfm_file, dtype=dtype, mode='r', offset=offset, shape=shape)
+        else:
+            data = np.fromfile(pfm_file, dtype=dtype, count=width * height * channels).reshape(shape)
+
+    data = data[::-1]
+    scale = abs(scale_endianess)
+    if scale != 1:
+        data = data * scale
+    return data
+
+
+def write_pfm(data, path):
+    # Writes a top-down grayscale (h, w) or color (h, w, 3) array as little-endian PFM. Rows are
+    # written bottom row first straight from the array, only a single row is converted to
+    # float32 at a time if data has another type.
+    data = np.asarray(data)
+    height, width = np.shape(data)[:2]
+    identifier = 'PF' if np.ndim(data) == 3 else 'Pf'
+
+    with open(path, 'wb') as pfm_file:
+        # header
+        pfm_file.write(('%s\n%d %d\n%d\n' % (identifier, width, height, -1)).encode('utf-8'))
+
+        # data
+        for row in data[::-1]:
+            np.ascontiguousarray(row, dtype='<f4').tofile(pfm_file)
@@ -18,12 +18,16 @@ from bpy.props import *
 import sys, os, json
 
 import os
+import time
 import random
 import shutil
 import pathlib
 import numpy as np
 import glob
 
+from .view_store import get_view_store, iter_decoded
+from .render_manifest import RenderManifest
+
 from math import *
 from mathutils import *
 
@@ -34,94 +38,142 @@ class OBJECT_OT_render_pointcloud(bpy.types.Operator):
     bl_label = """Render Point Cloud"""
     bl_options = {'REGISTER'}
 
+    # Back-project in double instead of single precision
+    use_double_precision: BoolProperty(name='Double precision', default=False)
+    use_ascii: BoolProperty(name='ASCII', description='Export using ASCII file format, otherwise use binary', default=False)
+
     def execute(self, context):
         
-        import cv2
         # INITIALIZE ATTRIBUTES
         # +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
         
         LF = bpy.context.scene.LF
-        
-        # Image attributes
-        self.rgb_list = []
-        self.depth_list = []
-        self.depth_list_pfm = []
-        self.num_points = LF.x_res * LF.y_res
+        tgt_dir = bpy.path.abspath(LF.tgt_dir)
         self.point_cloud_name = LF.point_cloud_name
-        
-        #if LF.sequence_start == LF.sequence_end:
-            #bpy.context.scene.frame_current = LF.sequence_start
-            
-        # Sort images in path. Read them and append them to the list of images
-        sorted_rgb = sorted(glob.glob(LF.tgt_dir + "/input_Cam*.png"))
-        sorted_depth = sorted(glob.glob(LF.tgt_dir + "/gt_disp_lowres*.png"))
-        sorted_depth_pfm = sorted(glob.glob(LF.tgt_dir + "/gt_disp_lowres*.pfm"))
-        
-        # Check if PNG disparity maps exist. If not, check if PFM disparity maps exist
-        if len(sorted_depth) and len(sorted_rgb) > 0:
-            
-            for filename in sorted_rgb:
-                img = cv2.imread(filename)
-                self.rgb_list.append(img)
-                
-            for filename in sorted_depth:
-                img = cv2.imread(filename)
-                self.depth_list.append(img)
-                
-            self.renderPointCloud(LF, LF.tgt_dir)
-        
-        elif len(sorted_depth_pfm) and len(sorted_rgb) > 0:
-            
-            for filename in sorted_rgb:
-                img = cv2.imread(filename)
-                self.rgb_list.append(img)
-                
-            for filename in sorted_depth_pfm:
-                img = self.read_pfm(filename)
-                self.depth_list_pfm.append(img)
-                
-            self.renderPointCloud(LF, LF.tgt_dir)
-        
+
+        # Views with an input image and a disparity map
+        if LF.use_point_cloud_fusion:
+            views = LF.get_camera_indices()
         else:
-            "Display message to render light field first to generate views and depth maps"
-            
-        
+            views = [LF.get_center_camera_index()]
+        self.view_files = [(idx,) + self.get_view_files(LF, tgt_dir, idx) for idx in views]
+        self.view_files = [files for files in self.view_files if files[2] is not None]
+
+        # PNG disparity maps are scaled to the disparity range of their own view
+        manifest = RenderManifest(tgt_dir)
+        self.disparity_ranges = {}
+        for idx, rgb_path, disp_path in list(self.view_files):
+            if disp_path.endswith('.png'):
+                self.disparity_ranges[idx] = self.get_disparity_range(LF, manifest, idx, disp_path)
+                if self.disparity_ranges[idx] is None:
+                    print("Leaving out view %d, the disparity range of '%s' is unknown. "
+                          "Save the disparity maps as PFM." % (idx, disp_path))
+                    self.view_files.remove((idx, rgb_path, disp_path))
+
+        if len(self.view_files) == 0:
+            self.report({'ERROR'}, "Render the light field first to generate the views and disparity maps")
+            return {'CANCELLED'}
+
+        self.renderPointCloud(LF, tgt_dir)
+
         return {'FINISHED'} 
+
+
+    @staticmethod
+    def get_view_files(LF, tgt_dir, idx):
+        # Input image and disparity map of a view, (None, None) if one of them is missing. The center
+        # view disparity map is saved without camera suffix unless the maps of all views are saved.
+        camera_name = 'Cam%3.3i' % idx
+        suffixes = ['_' + camera_name]
+        if idx == LF.get_center_camera_index():
+            suffixes.insert(0, '')
+
+        rgb_path = os.path.join(tgt_dir, 'input_%s.png' % camera_name)
+        disp_paths = [os.path.join(tgt_dir, 'gt_disp_lowres%s.%s' % (suffix, extension))
+                      for extension in ('pfm', 'png') for suffix in suffixes]
+        disp_paths = [path for path in disp_paths if os.path.exists(path)]
+        if not os.path.exists(rgb_path) or len(disp_paths) == 0:
+            return None, None
+        return rgb_path, disp_paths[0]
+
+
+    @staticmethod
+    def get_disparity_range(LF, manifest, idx, path):
+        # Disparity range a PNG map was scaled to, recorded with the depth maps of its view.
+        # The range of the light field settings is the one of the last depth map rendered, which is
+        # only known to be this map if it is the single center view map. None if unknown.
+        entry = manifest.get('depth_Cam%3.3i' % idx)
+        if entry is not None and os.path.basename(path) in entry['files'] and 'min_disp' in entry:
+            return entry['min_disp'], entry['max_disp']
+        if os.path.basename(path) == 'gt_disp_lowres.png' and not LF.save_depth_for_all_views:
+            return LF.min_disp, LF.max_disp
+        return None
+
+
+    def read_disparity(self, LF, tgt_dir, idx, path):
+        # PFM disparity maps hold the disparity itself, PNG maps are scaled to [min_disp, max_disp]
+        view_store = get_view_store(LF)
+        frame = bpy.context.scene.frame_current
+        if path.endswith('.pfm'):
+            return view_store.get(tgt_dir, 'Cam%3.3i' % idx, frame, 'disp', path)
+        min_disp, max_disp = self.disparity_ranges[idx]
+        disp_png = view_store.get(tgt_dir, 'Cam%3.3i' % idx, frame, 'disp_png', path)[:, :, 0]
+        return min_disp + (max_disp - min_disp) * disp_png / 255.
     
     
     def renderPointCloud(self, LF, tgt_dir):
         """""""""""""""""""""""""""""""""""""""""""""""""""""""""
         Render Point Cloud of the scene
         """""""""""""""""""""""""""""""""""""""""""""""""""""""""
-        LF = bpy.context.scene.LF
-        
-        # Create new empty points array
-        points = np.zeros((LF.x_res * LF.y_res, 3), np.float32)
-        color = np.zeros((LF.x_res * LF.y_res, 3), np.int)
-        
-        # For loop to set the depth and color values
-        c = 0
-        idx = 0
-        for i in range(0, LF.x_res):
-            for j in range(0, LF.y_res):
-                points[c, 0] = j
-                points[c, 1] = i
-                im_rgb = self.rgb_list[idx]
-                # In case it is using RGB disparity map
-                if len(self.depth_list) > 0:
-                    im_depth = self.depth_list[idx]
-                    points[c, 2] = im_depth[i, j, 0]
-                # In case it is using PFM disparity map
-                elif len(self.depth_list_pfm) > 0:
-                    MIN = 0
-                    MAX = 512
-                    im_depth = self.depth_list_pfm[idx]
-                    value = im_depth[i,j]
-                    points[c, 2] = self.range_adjust(MAX, LF.max_disp, LF.min_disp, value)
-                color[c] = im_rgb[i, j]
-                c += 1
-        
-        self.exportPlyFile(LF, LF.tgt_dir, points, color)
+        dtype = np.float64 if self.use_double_precision else np.float32
+        table = LF.get_camera_table()
+        if LF.use_point_cloud_fusion:
+            voxel_grid = VoxelGrid(LF.point_cloud_voxel_size)
+
+        def decode(view_files):
+            idx, rgb_path, disp_path = view_files
+            print("Adding view %s to the point cloud" % rgb_path)
+            frame = bpy.context.scene.frame_current
+            rgb = get_view_store(LF).get(tgt_dir, 'Cam%3.3i' % idx, frame, 'input', rgb_path)
+            return idx, rgb, self.read_disparity(LF, tgt_dir, idx, disp_path)
+
+        # Views are decoded in parallel a few views ahead and merged one at a time,
+        # so that memory scales with the number of voxels
+        start = time.perf_counter()
+        for idx, rgb, disp in iter_decoded(decode, self.view_files, LF.decode_workers):
+            pos_x, pos_y, shift_x, shift_y = table[idx]
+
+            # Metric points in the frame of the light field container
+            points, valid = disparity_to_points(disp, LF, dtype, shift_x, shift_y)
+            points[:, :, 0] += dtype(pos_x)
+            points[:, :, 1] += dtype(pos_y)
+
+            # Pixels at infinite distance have no point
+            points = points[valid]
+            color = rgb[valid]
+
+            if LF.use_point_cloud_fusion:
+                voxel_grid.add(points, color)
+
+        duration = max(time.perf_counter() - start, 1e-6)
+        print("Processed %d view(s) with %d decode worker(s) in %.3f s (%.1f views/s)"
+              % (len(self.view_files), LF.decode_workers, duration, len(self.view_files) / duration))
+
+        if LF.use_point_cloud_fusion:
+            points, color = voxel_grid.get_points()
+            points = points.astype(dtype)
+            color = np.round(color).astype(np.uint8)
+            print("Fused %d view(s) into %d point(s)" % (len(self.view_files), len(points)))
+
+        # Move the points to world coordinates
+        try:
+            matrix = np.array(bpy.data.objects[LF.get_lightfield_name()].matrix_world, dtype=dtype)
+            points = points @ matrix[:3, :3].T + matrix[:3, 3]
+        except KeyError:
+            pass
+        self.num_points = len(points)
+
+        self.exportPlyFile(LF, tgt_dir, points, color)
         
                         
     def exportPlyFile(self, LF, tgt_dir, points, color):
@@ -133,64 +185,205 @@ class OBJECT_OT_render_pointcloud(bpy.types.Operator):
         # Path to export ply file
         filename = str(LF.point_cloud_name)
         path = tgt_dir + "/" + filename + ".ply"
-        
-        with open(path, 'w', encoding='ascii') as ply_file:
-            # Write headers
-            headers = ["ply\n",
-                       "format ascii 1.0\n",
-                       "element face 0\n",
-                       "property list uchar int vertex_indices\n",
-                       "element vertex %d\n" % self.num_points,
-                       "property float x\n",
-                       "property float y\n",
-                       "property float z\n",
-                       "property uchar diffuse_red\n",
-                       "property uchar diffuse_green\n",
-                       "property uchar diffuse_blue\n",
-                       "end_header\n"]
-
-            for header in headers:
-                ply_file.write(header)
-
-            # Write point position and color
-            for pt_idx in range(0, self.num_points):
-                pt_pos = points[pt_idx]
-                pt_color = color[pt_idx]
-                ply_file.write("%f %f %f %d %d %d\n" % (pt_pos[1], pt_pos[0], pt_pos[2], int(pt_color[2]), int(pt_color[1]), int(pt_color[0])))
-
-
-    def read_pfm(self, filename):
-        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
-        Read pfm file to generate Point Cloud from it
-        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
-        from pathlib import Path
-        import struct
-        
-        with Path(filename).open('rb') as pfm_file:
-            line1, line2, line3 = (pfm_file.readline().decode('latin-1').strip() for _ in range(3))
-            assert line1 in ('PF', 'Pf')
-
-            channels = 3 if "PF" in line1 else 1
-            width, height = (int(s) for s in line2.split())
-            scale_endianess = float(line3)
-            bigendian = scale_endianess > 0
-            scale = abs(scale_endianess)
-
-            buffer = pfm_file.read()
-            samples = width * height * channels
-            assert len(buffer) == samples * 4
-
-            fmt = f'{"<>"[bigendian]}{samples}f'
-            decoded = struct.unpack(fmt, buffer)
-            shape = (height, width, 3) if channels == 3 else (height, width)
-            return np.flipud(np.reshape(decoded, shape)) * scale
-        
-    def range_adjust(self, max, disp_max, disp_min, value):
-        ans = max * (value - disp_min) / (disp_max - disp_min)
-        return ans
+
+        # colors are read by OpenCV in BGR order
+        write_ply(path, points, color[:, ::-1], use_ascii=self.use_ascii)
+        if LF.use_point_cloud_lod:
+            write_ply_octree(path, points, color[:, ::-1], LF.point_cloud_lod_levels)
+
+
+def disparity_to_points(disp, LF, dtype=np.float32, shift_x=0., shift_y=0.):
+    # Back-projects a top-down disparity map of a view to metric points in its camera frame
+    # (x right, y up, looking along -z). Inverts the disparity of the depth map export,
+    # disp = b * f_px * (1 / depth - 1 / focus_dist) with the focal length in pixels
+    # f_px = focal_length * max_res / sensor_size. The sensor shift of the view moves the principal
+    # point by shift * max_res pixels. Returns (h, w, 3) points and the finite mask.
+    height, width = np.shape(disp)
+    max_res = max(LF.x_res, LF.y_res)
+    f_px = dtype(LF.focal_length * max_res / LF.sensor_size)
+    baseline = dtype(LF.baseline_x_m)
+
+    inv_depth = np.asarray(disp, dtype=dtype) / (baseline * f_px) + dtype(1. / LF.focus_dist)
+    valid = inv_depth > 0
+    with np.errstate(divide='ignore'):
+        depth = np.where(valid, dtype(1.) / inv_depth, dtype(0.))
+
+    # pixel centers relative to the principal point, rows are counted from the top
+    x = (np.arange(width, dtype=dtype) + dtype(0.5) - dtype(width / 2. - shift_x * max_res)) / f_px
+    y = (dtype(height / 2. + shift_y * max_res) - np.arange(height, dtype=dtype) - dtype(0.5)) / f_px
+
+    points = np.empty((height, width, 3), dtype=dtype)
+    points[:, :, 0] = x[np.newaxis, :] * depth
+    points[:, :, 1] = y[:, np.newaxis] * depth
+    points[:, :, 2] = -depth
+    return points, valid
+
+
+class VoxelGrid:
+    """
+    Hashed voxel grid merging point clouds: all points falling into one voxel are replaced by their
+    mean position and mean color. Only occupied voxels are stored, as sorted 64 bit voxel keys with
+    running sums, so memory scales with the number of occupied voxels.
+    """
+
+    # bits per voxel coordinate in the packed key
+    KEY_BITS = 21
+
+    def __init__(self, voxel_size):
+        self.voxel_size = voxel_size
+        self.keys = np.empty(0, dtype=np.int64)
+        self.point_sums = np.empty((0, 3), dtype=np.float64)
+        self.color_sums = np.empty((0, 3), dtype=np.float64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def get_keys(self, points):
+        offset = 1 << (self.KEY_BITS - 1)
+        voxels = np.floor(points / self.voxel_size).astype(np.int64) + offset
+        if np.any(voxels < 0) or np.any(voxels >= 2 * offset):
+            raise ValueError("Point cloud extends beyond %d voxels, increase the voxel size" % offset)
+        return (voxels[:, 0] << (2 * self.KEY_BITS)) | (voxels[:, 1] << self.KEY_BITS) | voxels[:, 2]
+
+    def add(self, points, colors):
+        keys = np.concatenate((self.keys, self.get_keys(points)))
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.ravel()
+
+        num_voxels = len(self.keys)
+        old = inverse[:len(self.counts)]
+        new = inverse[len(self.counts):]
+        counts = np.bincount(old, weights=self.counts, minlength=num_voxels) + np.bincount(new, minlength=num_voxels)
+        point_sums = np.empty((num_voxels, 3), dtype=np.float64)
+        color_sums = np.empty((num_voxels, 3), dtype=np.float64)
+        for axis in range(0, 3):
+            point_sums[:, axis] = (np.bincount(old, weights=self.point_sums[:, axis], minlength=num_voxels)
+                                   + np.bincount(new, weights=points[:, axis], minlength=num_voxels))
+            color_sums[:, axis] = (np.bincount(old, weights=self.color_sums[:, axis], minlength=num_voxels)
+                                   + np.bincount(new, weights=colors[:, axis], minlength=num_voxels))
+
+        self.counts = counts.astype(np.int64)
+        self.point_sums = point_sums
+        self.color_sums = color_sums
+
+    def get_points(self):
+        """
+        Mean position and mean color of every occupied voxel
+        """
+        return self.point_sums / self.counts[:, np.newaxis], self.color_sums / self.counts[:, np.newaxis]
+
+
+def write_ply(path, points, colors, normals=None, use_ascii=False):
+    # Writes a point cloud with uchar RGB colors and optional normals. All vertices are packed
+    # into one structured array, which is written with a single buffer write in binary mode.
+    # Returns the size of the header, i.e. the byte offset of the first vertex.
+    properties = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+    if normals is not None:
+        properties += [('nx', '<f4'), ('ny', '<f4'), ('nz', '<f4')]
+    properties += [('diffuse_red', 'u1'), ('diffuse_green', 'u1'), ('diffuse_blue', 'u1')]
+
+    vertices = np.empty(len(points), dtype=properties)
+    vertices['x'], vertices['y'], vertices['z'] = np.asarray(points).T
+    if normals is not None:
+        vertices['nx'], vertices['ny'], vertices['nz'] = np.asarray(normals).T
+    vertices['diffuse_red'], vertices['diffuse_green'], vertices['diffuse_blue'] = np.asarray(colors).T
+
+    ply_types = {'<f4': 'float', 'u1': 'uchar'}
+    headers = ["ply\n",
+               "format %s 1.0\n" % ('ascii' if use_ascii else 'binary_little_endian'),
+               "element vertex %d\n" % len(vertices)]
+    headers += ["property %s %s\n" % (ply_types[prop_type], name) for name, prop_type in properties]
+    headers += ["element face 0\n",
+                "property list uchar int vertex_indices\n",
+                "end_header\n"]
+
+    header = ''.join(headers).encode('ascii')
+    with open(path, 'wb') as ply_file:
+        ply_file.write(header)
+        if use_ascii:
+            # formatted in chunks to bound the memory of the text
+            line = ' '.join('%f' if prop_type == '<f4' else '%d' for name, prop_type in properties) + '\n'
+            for start in range(0, len(vertices), 1000000):
+                rows = vertices[start:start + 1000000].tolist()
+                ply_file.write(''.join(line % row for row in rows).encode('ascii'))
+        else:
+            vertices.tofile(ply_file)
+
+    return len(header)
+
+
+def write_ply_octree(path, points, colors, num_levels, node_resolution=64):
+    # Writes a level of detail hierarchy next to the flat point cloud at path (*.ply). Level l is
+    # a binary PLY holding one point per voxel of size node_size / node_resolution, where the nodes
+    # are the cells of an octree of depth l over the bounding cube. The last level holds all points.
+    # Points of a level are grouped by node, and the JSON index lists for every node its octree
+    # coordinates, the tight bounds of its points and the byte range in the level file, so that
+    # consumers can stream coarse levels first and read only the nodes they need.
+    import json
+
+    points = np.asarray(points, dtype=np.float32)
+    point_size = 3 * 4 + 3 * 1
+    base_path = os.path.splitext(path)[0]
+
+    # e.g. all views masked, the index has no levels
+    if len(points) == 0:
+        with open(base_path + '_lod.json', 'w') as index_file:
+            json.dump({'version': 1, 'root_min': [0.0, 0.0, 0.0], 'root_size': 0.0, 'point_size': point_size,
+                       'num_points': 0, 'levels': []}, index_file)
+        return
+
+    root_min = points.min(axis=0).astype(np.float64)
+    root_size = max(float((points.max(axis=0) - root_min).max()), 1e-6) * (1 + 1e-6)
+
+    index = {'version': 1, 'root_min': root_min.tolist(), 'root_size': root_size, 'point_size': point_size,
+             'num_points': len(points), 'levels': []}
+    for level in range(0, num_levels):
+        num_nodes = 2 ** level
+        node_size = root_size / num_nodes
+
+        # one point per voxel, all points on the last level
+        if level < num_levels - 1:
+            resolution = num_nodes * node_resolution
+            voxels = np.floor((points - root_min) / (root_size / resolution)).astype(np.int64)
+            voxels = np.minimum(voxels, resolution - 1)
+            voxel_keys = (voxels[:, 0] * resolution + voxels[:, 1]) * resolution + voxels[:, 2]
+            unique_keys, selected = np.unique(voxel_keys, return_index=True)
+            selected = np.sort(selected)
+        else:
+            selected = np.arange(len(points))
+        level_points = points[selected]
+        level_colors = colors[selected]
+
+        # group the points by octree node
+        nodes = np.minimum(np.floor((level_points - root_min) / node_size).astype(np.int64), num_nodes - 1)
+        node_keys = (nodes[:, 0] * num_nodes + nodes[:, 1]) * num_nodes + nodes[:, 2]
+        order = np.argsort(node_keys, kind='stable')
+        level_points = level_points[order]
+        level_colors = level_colors[order]
+        node_keys = node_keys[order]
+        starts = np.flatnonzero(np.r_[True, node_keys[1:] != node_keys[:-1]])
+        counts = np.diff(np.r_[starts, len(node_keys)])
+
+        level_path = '%s_lod%d.ply' % (base_path, level)
+        data_offset = write_ply(level_path, level_points, level_colors)
+
+        node_min = np.minimum.reduceat(level_points, starts, axis=0)
+        node_max = np.maximum.reduceat(level_points, starts, axis=0)
+        node_coords = nodes[order][starts]
+        index['levels'].append({
+            'level': level,
+            'file': os.path.basename(level_path),
+            'num_points': len(level_points),
+            'node_size': node_size,
+            # [i, j, k, xmin, ymin, zmin, xmax, ymax, zmax, byte offset, number of points] per node
+            'nodes': [coords + bounds_min + bounds_max + [data_offset + int(start) * point_size, int(count)]
+                      for coords, bounds_min, bounds_max, start, count
+                      in zip(node_coords.tolist(), node_min.tolist(), node_max.tolist(), starts, counts)],
+        })
+        print("Point cloud level %d: %d point(s) in %d node(s)" % (level, len(level_points), len(starts)))
+
+    with open(base_path + '_lod.json', 'w') as index_file:
+        json.dump(index, index_file)
 
 
-        
 from bpy.props import (
     CollectionProperty,
     StringProperty,
@@ -246,6 +439,14 @@ class OBJECT_OT_EXPORT_PLY(bpy.types.Operator, ExportHelper):
         description="Export the active vertex color layer",
         default=True,
     )
+    use_streaming: BoolProperty(
+        name="Stream Objects",
+        description=(
+            "Write the objects one at a time with their faces instead of merging the scene into one mesh first, "
+            "memory is bounded by the largest object"
+        ),
+        default=False,
+    )
     global_scale: FloatProperty(
         name="Scale",
         min=0.01,
@@ -289,159 +490,137 @@ class OBJECT_OT_EXPORT_PLY(bpy.types.Operator, ExportHelper):
 
         col = layout.column(heading="Format")
         col.prop(operator, "use_ascii")
+        col.prop(operator, "use_streaming")
         
         
-    def _write_binary(self, fw, ply_verts, ply_faces, mesh_verts):
-        from struct import pack
-        for index, normal, uv_coords, color in ply_verts:
-            fw(pack("<3f", *mesh_verts[index].co))
-            if normal is not None:
-                fw(pack("<3f", *normal))
-            if uv_coords is not None:
-                fw(pack("<2f", *uv_coords))
-            if color is not None:
-                fw(pack("<4B", *color))
-
-
-    def _write_ascii(self, fw, ply_verts, ply_faces, mesh_verts):
-
-        for index, normal, uv_coords, color in ply_verts:
-            fw(b"%.6f %.6f %.6f" % mesh_verts[index].co[:])
-            if normal is not None:
-                fw(b" %.6f %.6f %.6f" % normal)
-            if uv_coords is not None:
-                fw(b" %.6f %.6f" % uv_coords)
-            if color is not None:
-                fw(b" %u %u %u %u" % color)
-            fw(b"\n")
+    def _write_binary(self, fw, ply_verts):
+        fw(ply_verts.tobytes())
 
-    def save_mesh(self, filepath, mesh, use_ascii, use_normals, use_uv_coords, use_colors):
+
+    def _write_ascii(self, fw, ply_verts):
+        # same formatting as one "%.6f" / "%u" per value, applied to chunks of rows
+        line = b" ".join(b"%u" if ply_verts.dtype[name] == np.uint8 else b"%.6f" for name in ply_verts.dtype.names) + b"\n"
+        for start in range(0, len(ply_verts), 1000000):
+            rows = ply_verts[start:start + 1000000].tolist()
+            fw(b"".join(line % row for row in rows))
+
+    def _write_header(self, fw, use_ascii, num_verts, num_faces, use_normals, use_uv_coords, use_colors, count_width=0):
         import bpy
 
-        def rvec3d(v):
-            return round(v[0], 6), round(v[1], 6), round(v[2], 6)
+        file_format = b"ascii" if use_ascii else b"binary_little_endian"
 
-        def rvec2d(v):
-            return round(v[0], 6), round(v[1], 6)
+        fw(b"ply\n")
+        fw(b"format %s 1.0\n" % file_format)
+        fw(b"comment Created by Blender %s - www.blender.org\n" % bpy.app.version_string.encode("utf-8"))
 
-        if use_uv_coords and mesh.uv_layers:
-            active_uv_layer = mesh.uv_layers.active.data
-        else:
-            use_uv_coords = False
+        # counts can be padded to count_width, so that they can be patched in place later
+        fw(b"element vertex %-*d\n" % (count_width, num_verts))
+        fw(
+            b"property float x\n"
+            b"property float y\n"
+            b"property float z\n"
+        )
+        if use_normals:
+            fw(
+                b"property float nx\n"
+                b"property float ny\n"
+                b"property float nz\n"
+            )
+        if use_uv_coords:
+            fw(
+                b"property float s\n"
+                b"property float t\n"
+            )
+        if use_colors:
+            fw(
+                b"property uchar red\n"
+                b"property uchar green\n"
+                b"property uchar blue\n"
+                b"property uchar alpha\n"
+            )
 
-        if use_colors and mesh.vertex_colors:
-            active_col_layer = mesh.vertex_colors.active.data
-        else:
-            use_colors = False
-
-        # in case
-        color = uvcoord = uvcoord_key = normal = normal_key = None
-
-        mesh_verts = mesh.vertices
-        # vdict = {} # (index, normal, uv) -> new index
-        vdict = [{} for i in range(len(mesh_verts))]
-        ply_verts = []
-        ply_faces = [[] for f in range(len(mesh.polygons))]
-        vert_count = 0
-
-        for i, f in enumerate(mesh.polygons):
-
-            if use_normals:
-                smooth = f.use_smooth
-                if not smooth:
-                    normal = f.normal[:]
-                    normal_key = rvec3d(normal)
-
-            if use_uv_coords:
-                uv = [
-                    active_uv_layer[l].uv[:]
-                    for l in range(f.loop_start, f.loop_start + f.loop_total)
-                ]
-            if use_colors:
-                col = [
-                    active_col_layer[l].color[:]
-                    for l in range(f.loop_start, f.loop_start + f.loop_total)
-                ]
-
-            pf = ply_faces[i]
-            for j, vidx in enumerate(f.vertices):
-                v = mesh_verts[vidx]
-
-                if use_normals and smooth:
-                    normal = v.normal[:]
-                    normal_key = rvec3d(normal)
-
-                if use_uv_coords:
-                    uvcoord = uv[j][0], uv[j][1]
-                    uvcoord_key = rvec2d(uvcoord)
-
-                if use_colors:
-                    color = col[j]
-                    color = (
-                        int(color[0] * 255.0),
-                        int(color[1] * 255.0),
-                        int(color[2] * 255.0),
-                        int(color[3] * 255.0),
-                    )
-                key = normal_key, uvcoord_key, color
-
-                vdict_local = vdict[vidx]
-                pf_vidx = vdict_local.get(key)  # Will be None initially
-
-                if pf_vidx is None:  # Same as vdict_local.has_key(key)
-                    pf_vidx = vdict_local[key] = vert_count
-                    ply_verts.append((vidx, normal, uvcoord, color))
-                    vert_count += 1
-
-                pf.append(pf_vidx)
+        fw(b"element face %-*d\n" % (count_width, num_faces))
+        fw(b"property list uchar uint vertex_indices\n")
+        fw(b"end_header\n")
+
+    def save_mesh(self, filepath, mesh, use_ascii, use_normals, use_uv_coords, use_colors):
+        use_uv_coords = use_uv_coords and len(mesh.uv_layers) > 0
+        use_colors = use_colors and len(mesh.vertex_colors) > 0
+        ply_verts, loop_verts, loop_totals = get_ply_vertices(mesh, use_normals, use_uv_coords, use_colors)
 
         with open(filepath, "wb") as file:
             fw = file.write
-            file_format = b"ascii" if use_ascii else b"binary_little_endian"
 
             # Header
             # ---------------------------
 
-            fw(b"ply\n")
-            fw(b"format %s 1.0\n" % file_format)
-            fw(b"comment Created by Blender %s - www.blender.org\n" % bpy.app.version_string.encode("utf-8"))
-
-            fw(b"element vertex %d\n" % len(ply_verts))
-            fw(
-                b"property float x\n"
-                b"property float y\n"
-                b"property float z\n"
-            )
-            if use_normals:
-                fw(
-                    b"property float nx\n"
-                    b"property float ny\n"
-                    b"property float nz\n"
-                )
-            if use_uv_coords:
-                fw(
-                    b"property float s\n"
-                    b"property float t\n"
-                )
-            if use_colors:
-                fw(
-                    b"property uchar red\n"
-                    b"property uchar green\n"
-                    b"property uchar blue\n"
-                    b"property uchar alpha\n"
-                )
-
-            fw(b"element face %d\n" % len(mesh.polygons))
-            fw(b"property list uchar uint vertex_indices\n")
-            fw(b"end_header\n")
+            self._write_header(fw, use_ascii, len(ply_verts), len(mesh.polygons), use_normals, use_uv_coords, use_colors)
 
             # Geometry
             # ---------------------------
 
             if use_ascii:
-                self._write_ascii(fw, ply_verts, ply_faces, mesh_verts)
+                self._write_ascii(fw, ply_verts)
             else:
-                self._write_binary(fw, ply_verts, ply_faces, mesh_verts)
+                self._write_binary(fw, ply_verts)
+
+    def save_streaming(self, filepath, objects, depsgraph, use_ascii, use_mesh_modifiers, use_normals,
+                       use_uv_coords, use_colors, global_matrix):
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        Writes the objects one at a time. The vertices follow a
+        provisional header, the faces are collected in a sidecar
+        file and appended at the end, then the element counts of
+        the header are patched in place
+        """""""""""""""""""""""""""""""""""""""""""""""""""""""""
+        import tempfile
+
+        num_verts = 0
+        num_faces = 0
+        with open(filepath, "w+b") as file, tempfile.TemporaryFile(dir=os.path.dirname(filepath)) as face_file:
+            self._write_header(file.write, use_ascii, 0, 0, use_normals, use_uv_coords, use_colors, count_width=20)
+
+            for ob in objects:
+                ob_eval = ob.evaluated_get(depsgraph) if use_mesh_modifiers else ob
+                try:
+                    me = ob_eval.to_mesh()
+                except RuntimeError:
+                    continue
+                if me is None:
+                    continue
+
+                me.transform(ob.matrix_world)
+                if global_matrix is not None:
+                    me.transform(global_matrix)
+                if use_normals:
+                    me.calc_normals()
+
+                # layers missing on this object are written as zero uvs and white colors
+                ply_verts, loop_verts, loop_totals = get_ply_vertices(me, use_normals, use_uv_coords, use_colors,
+                                                                      fill_missing=True)
+                ob_eval.to_mesh_clear()
+
+                if use_ascii:
+                    self._write_ascii(file.write, ply_verts)
+                    write_ply_faces_ascii(face_file.write, loop_verts + num_verts, loop_totals)
+                else:
+                    self._write_binary(file.write, ply_verts)
+                    write_ply_faces_binary(face_file.write, loop_verts + num_verts, loop_totals)
+                num_verts += len(ply_verts)
+                num_faces += len(loop_totals)
+
+            # append the faces in chunks
+            face_file.seek(0)
+            shutil.copyfileobj(face_file, file)
+
+            # patch the element counts of the provisional header
+            file.seek(0)
+            header = file.read(4096)
+            for element, count in ((b"vertex", num_verts), (b"face", num_faces)):
+                offset = header.index(b"element %s " % element) + len(b"element %s " % element)
+                file.seek(offset)
+                file.write(b"%-20d" % count)
+
+        return num_verts, num_faces
 
 
     def save(self, 
@@ -453,6 +632,7 @@ class OBJECT_OT_EXPORT_PLY(bpy.types.Operator, ExportHelper):
         use_normals=True,
         use_uv_coords=True,
         use_colors=True,
+        use_streaming=False,
         global_matrix=None,
     ):
         import time
@@ -470,6 +650,14 @@ class OBJECT_OT_EXPORT_PLY(bpy.types.Operator, ExportHelper):
             obs = context.scene.objects
 
         depsgraph = context.evaluated_depsgraph_get()
+
+        if use_streaming:
+            num_verts, num_faces = self.save_streaming(filepath, obs, depsgraph, use_ascii, use_mesh_modifiers, use_normals,
+                                                       use_uv_coords, use_colors, global_matrix)
+            t_delta = time.time() - t
+            print(f"Export completed {filepath!r} in {t_delta:.3f}: {num_verts} vertices, {num_faces} faces")
+            return
+
         bm = bmesh.new()
 
         for ob in obs:
@@ -512,6 +700,123 @@ class OBJECT_OT_EXPORT_PLY(bpy.types.Operator, ExportHelper):
         print(f"Export completed {filepath!r} in {t_delta:.3f}")
 
 
+def get_ply_vertices(mesh, use_normals, use_uv_coords, use_colors, fill_missing=False):
+    # Distinct (vertex, normal, uv, color) combinations of the mesh loops as a structured array
+    # of ply vertices, in the order of their first loop. Also returns the ply vertex of every loop
+    # in the order of the polygons, and the number of loops of every polygon. With fill_missing a
+    # missing uv or color layer gives zero uvs and white colors instead of raising.
+    num_polygons = len(mesh.polygons)
+    loop_starts = np.empty(num_polygons, dtype=np.int64)
+    loop_totals = np.empty(num_polygons, dtype=np.int64)
+    mesh.polygons.foreach_get('loop_start', loop_starts)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+    loop_faces = np.repeat(np.arange(num_polygons), loop_totals)
+    loop_order = np.arange(np.sum(loop_totals)) + np.repeat(loop_starts - np.cumsum(loop_totals) + loop_totals, loop_totals)
+
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int64)
+    mesh.loops.foreach_get('vertex_index', loop_vertices)
+    loop_vertices = loop_vertices[loop_order]
+    vertex_coords = np.empty((len(mesh.vertices), 3), dtype=np.float32)
+    mesh.vertices.foreach_get('co', vertex_coords.ravel())
+
+    # A ply vertex is added for every distinct (vertex, normal, uv, color) of the loops,
+    # where normals and uvs are compared after rounding to 6 decimals
+    fields = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+    keys = [loop_vertices[:, np.newaxis]]
+    values = [vertex_coords[loop_vertices]]
+
+    if use_normals:
+        # smooth faces use the vertex normals, flat faces the face normal
+        smooth = np.empty(num_polygons, dtype=bool)
+        polygon_normals = np.empty((num_polygons, 3), dtype=np.float32)
+        vertex_normals = np.empty((len(mesh.vertices), 3), dtype=np.float32)
+        mesh.polygons.foreach_get('use_smooth', smooth)
+        mesh.polygons.foreach_get('normal', polygon_normals.ravel())
+        mesh.vertices.foreach_get('normal', vertex_normals.ravel())
+        normals = np.where(smooth[loop_faces, np.newaxis], vertex_normals[loop_vertices], polygon_normals[loop_faces])
+
+        fields += [('nx', '<f4'), ('ny', '<f4'), ('nz', '<f4')]
+        keys.append(get_rounded_ids(normals, 6))
+        values.append(normals)
+
+    if use_uv_coords:
+        if mesh.uv_layers or not fill_missing:
+            active_uv_layer = mesh.uv_layers.active.data
+            uvs = np.empty((len(active_uv_layer), 2), dtype=np.float32)
+            active_uv_layer.foreach_get('uv', uvs.ravel())
+            uvs = uvs[loop_order]
+        else:
+            uvs = np.zeros((len(loop_order), 2), dtype=np.float32)
+
+        fields += [('s', '<f4'), ('t', '<f4')]
+        keys.append(get_rounded_ids(uvs, 6))
+        values.append(uvs)
+
+    if use_colors:
+        if mesh.vertex_colors or not fill_missing:
+            active_col_layer = mesh.vertex_colors.active.data
+            colors = np.empty((len(active_col_layer), 4), dtype=np.float32)
+            active_col_layer.foreach_get('color', colors.ravel())
+            colors = (colors[loop_order].astype(np.float64) * 255.0).astype(np.int64)
+        else:
+            colors = np.full((len(loop_order), 4), 255, dtype=np.int64)
+
+        fields += [('red', 'u1'), ('green', 'u1'), ('blue', 'u1'), ('alpha', 'u1')]
+        keys.append(colors)
+        values.append(colors)
+
+    # distinct keys, numbered in the order of their first loop
+    unique_keys, first_loops, inverse = np.unique(np.concatenate(keys, axis=1), axis=0,
+                                                  return_index=True, return_inverse=True)
+    order = np.argsort(first_loops)
+    first_loops = first_loops[order]
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order))
+    loop_verts = ranks[inverse.ravel()]
+
+    ply_verts = np.empty(len(first_loops), dtype=fields)
+    columns = [column for value in values for column in value[first_loops].T]
+    for name, column in zip(ply_verts.dtype.names, columns):
+        ply_verts[name] = column
+
+    return ply_verts, loop_verts, loop_totals
+
+
+def write_ply_faces_binary(fw, loop_verts, loop_totals):
+    # Faces as "list uchar uint" records: the number of vertices followed by the vertex indices
+    face_sizes = 1 + 4 * loop_totals
+    face_starts = np.cumsum(face_sizes) - face_sizes
+    buffer = np.empty(int(np.sum(face_sizes)), dtype=np.uint8)
+    buffer[face_starts] = loop_totals
+
+    # byte positions of the indices of every loop
+    loop_starts = np.repeat(face_starts + 1 - 4 * (np.cumsum(loop_totals) - loop_totals), loop_totals) + 4 * np.arange(len(loop_verts))
+    index_bytes = loop_verts.astype('<u4').view(np.uint8).reshape(-1, 4)
+    buffer[loop_starts[:, np.newaxis] + np.arange(4)] = index_bytes
+    fw(buffer.tobytes())
+
+
+def write_ply_faces_ascii(fw, loop_verts, loop_totals):
+    loop_ends = np.cumsum(loop_totals).tolist()
+    indices = loop_verts.tolist()
+    lines = []
+    start = 0
+    for end in loop_ends:
+        lines.append(b"%d %s\n" % (end - start, b" ".join(b"%d" % index for index in indices[start:end])))
+        start = end
+    fw(b"".join(lines))
+
+
+def get_rounded_ids(values, ndigits):
+    # Integer ids per value of (n, k) float values, equal for values that are equal after Python's
+    # round(value, ndigits). Every distinct value is rounded once with Python's round, so that the
+    # grouping matches rounding each value as a Python float.
+    unique_values, inverse = np.unique(values, return_inverse=True)
+    rounded = np.array([round(value, ndigits) for value in unique_values.tolist()])
+    unique_rounded, rounded_inverse = np.unique(rounded, return_inverse=True)
+    return rounded_inverse[inverse.ravel()].reshape(np.shape(values))
+
+
 classes = (
     OBJECT_OT_render_pointcloud,
     OBJECT_OT_EXPORT_PLY,
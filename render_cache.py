@@ -0,0 +1,238 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+import bpy
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import numpy as np
+
+
+# Properties of materials, lights and worlds that do not change the render
+IGNORED_PROPERTIES = ('name_full', 'users', 'session_uid', 'use_fake_user', 'tag')
+
+# File names of cache entries, <sha1 key>.<extension>. Other files in the cache directory are
+# never counted or evicted, so pointing the cache at an existing folder does not delete its files.
+CACHE_ENTRY_PATTERN = re.compile(r'^[0-9a-f]{40}\.[A-Za-z0-9]+$')
+
+
+class RenderCache:
+    """
+    On-disk cache of rendered outputs, addressed by a hash of everything that changes the render.
+    Hits are copied into the target directory instead of rendering again. Once the cache grows
+    beyond max_bytes the least recently used entries are evicted.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = bpy.path.abspath(directory)
+        self.max_bytes = max_bytes
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.total_bytes = sum(entry.stat().st_size for entry in self.get_entries())
+
+    def get_entries(self):
+        return [entry for entry in os.scandir(self.directory)
+                if entry.is_file() and CACHE_ENTRY_PATTERN.match(entry.name)]
+
+    def get_path(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def fetch(self, key, target_path):
+        """
+        Copies the cached output of key to target_path, returns False on a cache miss
+        """
+        extension = os.path.splitext(target_path)[1]
+        cache_path = self.get_path(key, extension)
+        if not os.path.exists(cache_path):
+            return False
+
+        copy_file(cache_path, target_path)
+
+        # mark the entry as recently used
+        os.utime(cache_path)
+        return True
+
+    def store(self, key, source_path):
+        """
+        Adds the rendered output at source_path to the cache
+        """
+        extension = os.path.splitext(source_path)[1]
+        cache_path = self.get_path(key, extension)
+        if not os.path.exists(cache_path):
+            copy_file(source_path, cache_path)
+            self.total_bytes += os.path.getsize(cache_path)
+            self.evict()
+
+    def load_array(self, key):
+        """
+        Cached numpy array of key, None on a cache miss
+        """
+        cache_path = self.get_path(key, '.npy')
+        if not os.path.exists(cache_path):
+            return None
+        os.utime(cache_path)
+        return np.load(cache_path)
+
+    def store_array(self, key, array):
+        cache_path = self.get_path(key, '.npy')
+        tmp_path = cache_path + '.tmp.npy'
+        np.save(tmp_path, array)
+        if os.path.exists(cache_path):
+            self.total_bytes -= os.path.getsize(cache_path)
+        os.replace(tmp_path, cache_path)
+        self.total_bytes += os.path.getsize(cache_path)
+        self.evict()
+
+    def evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        # the modification time of an entry is updated on every hit
+        entries = self.get_entries()
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        self.total_bytes = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+                self.total_bytes -= size
+            except OSError:
+                print("Could not evict render cache entry: '%s'" % entry.path)
+
+
+def get_render_cache(LF):
+    """
+    Render cache configured in the light field settings, None when the cache is disabled
+    """
+    if not LF.use_render_cache:
+        return None
+    return RenderCache(LF.render_cache_dir, LF.render_cache_size_mb * 1024 * 1024)
+
+
+def copy_file(source_path, target_path):
+    # Entries are copied rather than hardlinked, files in the target directory are written in place
+    # (e.g. by cv2.imwrite), which would change the shared cache entry. The copy replaces the target
+    # once it is complete.
+    tmp_path = target_path + '.tmp'
+    shutil.copyfile(source_path, tmp_path)
+    os.replace(tmp_path, target_path)
+
+
+def get_scene_hash():
+    """
+    Hash of the evaluated scene without the light field objects and cameras: object transforms,
+    evaluated geometry, materials, lights and world. Changes of external files, e.g. textures
+    edited on disk, are not detected.
+    """
+    scene = bpy.context.scene
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    sha = hashlib.sha1()
+    materials = set()
+
+    for ob_eval in sorted(depsgraph.objects, key=lambda ob: ob.name):
+        if ob_eval.type == 'CAMERA' or ob_eval.name.startswith("LF") or ob_eval.hide_render:
+            continue
+        state = [ob_eval.name, ob_eval.type, ob_eval.pass_index, [list(row) for row in ob_eval.matrix_world]]
+        state += [slot.material.name if slot.material else None for slot in ob_eval.material_slots]
+        materials.update(slot.material.original for slot in ob_eval.material_slots if slot.material)
+        if ob_eval.type == 'LIGHT':
+            state += [get_id_state(ob_eval.data)]
+        sha.update(json.dumps(state, default=str).encode('utf-8'))
+
+        if ob_eval.type in ('MESH', 'CURVE', 'SURFACE', 'META', 'FONT'):
+            try:
+                mesh = ob_eval.to_mesh()
+            except RuntimeError:
+                continue
+            coordinates = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+            mesh.vertices.foreach_get('co', coordinates)
+            sha.update(coordinates.tobytes())
+            polygon_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+            mesh.loops.foreach_get('vertex_index', polygon_vertices)
+            sha.update(polygon_vertices.tobytes())
+            ob_eval.to_mesh_clear()
+
+    for material in sorted(materials, key=lambda material: material.name):
+        sha.update(json.dumps([material.name, get_id_state(material)], default=str).encode('utf-8'))
+    if scene.world is not None:
+        sha.update(json.dumps(get_id_state(scene.world), default=str).encode('utf-8'))
+
+    return sha.hexdigest()
+
+
+def get_id_state(datablock):
+    # Plain properties and shader node values of a material, light or world
+    state = []
+    for prop in datablock.bl_rna.properties:
+        if prop.identifier in IGNORED_PROPERTIES or prop.identifier.startswith('is_'):
+            continue
+        if prop.type in ('BOOLEAN', 'INT', 'FLOAT', 'STRING', 'ENUM'):
+            state.append(get_value(getattr(datablock, prop.identifier)))
+    node_tree = getattr(datablock, 'node_tree', None)
+    if node_tree is not None:
+        for node in node_tree.nodes:
+            state.append([node.name, node.bl_idname])
+            state += [get_value(socket.default_value) for socket in node.inputs if hasattr(socket, 'default_value')]
+            image = getattr(node, 'image', None)
+            if image is not None:
+                state.append(image.filepath)
+        state += [[link.from_socket.identifier, link.from_node.name, link.to_socket.identifier, link.to_node.name]
+                  for link in node_tree.links]
+    return state
+
+
+def get_value(value):
+    try:
+        return list(value)
+    except TypeError:
+        return value
+
+
+def get_render_key(scene_hash, camera, seed, output):
+    """
+    Cache key of rendering the scene with camera and seed to the given kind of output
+    """
+    # update matrix_world of cameras that were just moved
+    bpy.context.view_layer.update()
+
+    camera_state = [[list(row) for row in camera.matrix_world], camera.data.type, camera.data.lens,
+                    camera.data.sensor_width, camera.data.sensor_height, camera.data.sensor_fit,
+                    camera.data.shift_x, camera.data.shift_y, camera.data.clip_start, camera.data.clip_end,
+                    camera.data.dof.use_dof, camera.data.dof.focus_distance, camera.data.dof.aperture_fstop,
+                    camera.data.dof.aperture_blades, camera.data.dof.aperture_rotation]
+
+    key = [scene_hash, camera_state, get_render_state(), seed, output]
+    return hashlib.sha1(json.dumps(key, default=str).encode('utf-8')).hexdigest()
+
+
+def get_render_state():
+    """
+    Render settings of the current scene that change the rendered images
+    """
+    scene = bpy.context.scene
+    render = scene.render
+    render_state = [render.engine, render.resolution_x, render.resolution_y, render.resolution_percentage,
+                    render.film_transparent, scene.view_settings.view_transform, scene.view_settings.look,
+                    scene.view_settings.exposure, scene.view_settings.gamma]
+    if render.engine == 'CYCLES':
+        render_state += [scene.cycles.samples, scene.cycles.max_bounces, scene.cycles.use_denoising]
+    else:
+        render_state += [scene.eevee.taa_render_samples]
+    return render_state
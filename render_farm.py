@@ -0,0 +1,153 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+import bpy
+from bpy.props import *
+
+import os
+import json
+import time
+import random
+import subprocess
+import configparser
+
+from .render_manifest import RenderManifest
+
+
+class OBJECT_OT_render_farm(bpy.types.Operator):
+    """Render light field with several background Blender processes"""
+    bl_idname = "scene.render_farm"
+    bl_label = """Render Light Field on worker processes"""
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+
+        # INITIALIZE ATTRIBUTES
+        # +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+        LF = bpy.context.scene.LF
+        tgt_root_dir = bpy.path.abspath(LF.tgt_dir)
+
+        frames = list(LF.get_sequence_frames())
+        num_views = len(LF.get_camera_indices())
+        num_workers = max(1, min(LF.farm_workers, len(frames) * num_views))
+        shards = split_work(frames, num_views, num_workers)
+
+        # All workers share one seed, each view is rendered with this seed plus its camera index.
+        # A resumed render keeps the seed of the views rendered before.
+        seed = RenderManifest(LF.get_frame_directory(frames[0])).get_base_seed()
+        if LF.render_seed >= 0:
+            seed = LF.render_seed
+        elif seed is None:
+            seed = random.randint(0, 2147483646 - num_views - 1)
+
+        # Workers load a copy of the current scene, so unsaved changes are rendered too
+        blend_path = os.path.join(tgt_root_dir, 'render_farm_scene.blend')
+        bpy.ops.wm.save_as_mainfile(filepath=blend_path, copy=True)
+
+        # Split the cores of the machine between the workers
+        threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+        # Start the workers
+        workers = []
+        for worker_idx, shard in enumerate(shards):
+            log_path = os.path.join(tgt_root_dir, 'render_farm_worker%02d.log' % worker_idx)
+            expression = ("import bpy; bpy.ops.scene.render_lightfield('EXEC_DEFAULT', shard=%r, seed=%d)"
+                          % (json.dumps(shard), seed))
+            # without --python-exit-code Blender exits with 0 even if the render raises
+            command = [bpy.app.binary_path, '-b', blend_path, '-t', str(threads), '--python-exit-code', '1',
+                       '--python-expr', expression]
+
+            log_file = open(log_path, 'w')
+            process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+            num_shard_views = sum(last_camera - first_camera for frame, first_camera, last_camera in shard)
+            workers.append([process, log_file, log_path, num_shard_views, time.time(), None])
+            print("Started render worker %d with %d view(s): %s" % (worker_idx, num_shard_views, shard))
+
+        # Wait for all workers and report their throughput
+        while any(worker[5] is None for worker in workers):
+            time.sleep(1)
+            for worker_idx, worker in enumerate(workers):
+                process, log_file, log_path, num_shard_views, start, end = worker
+                if end is None and process.poll() is not None:
+                    worker[5] = time.time()
+                    log_file.close()
+                    duration = worker[5] - start
+                    print("Render worker %d finished with code %d: %d view(s) in %.1f s (%.3f views/s)"
+                          % (worker_idx, process.returncode, num_shard_views, duration, num_shard_views / max(duration, 1e-6)))
+
+        os.remove(blend_path)
+
+        failed = [worker_idx for worker_idx, worker in enumerate(workers) if worker[0].returncode != 0]
+        if len(failed) > 0:
+            self.report({'ERROR'}, "Render worker(s) %s failed, see %s" % (failed, [workers[idx][2] for idx in failed]))
+            return {'CANCELLED'}
+
+        total_views = sum(worker[3] for worker in workers)
+        total_time = max(worker[5] for worker in workers) - min(worker[4] for worker in workers)
+        self.report({'INFO'}, "Rendered %d view(s) with %d workers in %.1f s (%.3f views/s)"
+                    % (total_views, num_workers, total_time, total_views / max(total_time, 1e-6)))
+
+        # Workers write straight into the frame folders, only post-processing is left
+        for frame in frames:
+            self.load_disparity_range(LF, LF.get_frame_directory(frame))
+        if LF.save_sidebyside_image or LF.save_lenslet_image or LF.save_container:
+            bpy.ops.scene.render_lightfield('EXEC_DEFAULT', skip_rendering=True)
+
+        return {'FINISHED'}
+
+    @staticmethod
+    def load_disparity_range(LF, tgt_dir):
+        # The disparity range is computed by the worker rendering the center view
+        parser = configparser.ConfigParser(delimiters="=")
+        if parser.read(os.path.join(tgt_dir, 'parameters.cfg')):
+            LF.min_disp = float(parser.get('meta', 'disp_min'))
+            LF.max_disp = float(parser.get('meta', 'disp_max'))
+
+
+def split_work(frames, num_views, num_shards):
+    # Splits the (frame x camera) work list into num_shards contiguous parts of nearly equal size.
+    # Each part is a list of [frame, first camera, last camera + 1] ranges.
+    num_items = len(frames) * num_views
+    shards = []
+    for shard_idx in range(0, num_shards):
+        start = shard_idx * num_items // num_shards
+        end = (shard_idx + 1) * num_items // num_shards
+        shard = []
+        while start < end:
+            frame_idx, first_camera = divmod(start, num_views)
+            last_camera = min(num_views, first_camera + end - start)
+            shard.append([frames[frame_idx], first_camera, last_camera])
+            start += last_camera - first_camera
+        shards.append(shard)
+    return shards
+
+
+classes = (
+    OBJECT_OT_render_farm,
+)
+
+def register():
+    from bpy.utils import register_class
+    for cls in classes:
+        register_class(cls)
+
+def unregister():
+    from bpy.utils import unregister_class
+    for cls in reversed(classes):
+        unregister_class(cls)
+
+if __name__ == "__main__":
+    register()
@@ -0,0 +1,119 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+import bpy
+
+import os
+import json
+import hashlib
+import threading
+
+from .render_cache import get_scene_hash, get_render_state
+
+
+MANIFEST_FILENAME = 'render_manifest.jsonl'
+
+# Light field properties that change the rendered images
+HASHED_PROPERTIES = (
+    'focal_length', 'x_res', 'y_res', 'sensor_size', 'fstop', 'num_blades', 'rotation',
+    'num_cams_x', 'num_cams_y', 'baseline_mm', 'focus_dist',
+)
+
+
+class RenderManifest:
+    """
+    Record of the finished outputs of a render in tgt_dir, used to resume interrupted renders.
+    Entries are appended as single JSON lines, so that a crash loses at most the entry being written
+    and several render processes can share one manifest. Later lines replace earlier ones.
+    """
+
+    def __init__(self, tgt_dir):
+        self.tgt_dir = tgt_dir
+        self.path = os.path.join(tgt_dir, MANIFEST_FILENAME)
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        try:
+            with open(self.path, 'r') as manifest_file:
+                for line in manifest_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # line of an interrupted write
+                        continue
+                    self.entries[entry['key']] = entry
+        except FileNotFoundError:
+            pass
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def is_valid(self, key, parameter_hash):
+        """
+        Whether the output key was rendered with the same parameters and all its files still exist
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry['hash'] != parameter_hash:
+            return False
+        return all(os.path.exists(os.path.join(self.tgt_dir, filename)) for filename in entry['files'])
+
+    def record(self, key, parameter_hash, seed, files, **values):
+        """
+        Marks the output key as completed, files are relative to tgt_dir
+        """
+        entry = dict(values, key=key, hash=parameter_hash, seed=seed, files=list(files))
+        with self.lock:
+            if not os.path.isdir(self.tgt_dir):
+                os.makedirs(self.tgt_dir)
+            with open(self.path, 'a') as manifest_file:
+                manifest_file.write(json.dumps(entry) + '\n')
+            self.entries[key] = entry
+
+    def get_base_seed(self):
+        """
+        Base seed of the views rendered so far, so that a resumed render matches an uninterrupted one
+        """
+        for entry in reversed(list(self.entries.values())):
+            if 'base_seed' in entry:
+                return entry['base_seed']
+        return None
+
+
+def get_parameter_hash(LF, scene_hash=None):
+    """
+    Hash of the light field setup, the render settings and the contents of the current scene
+    and frame. scene_hash is computed with get_scene_hash() if not given.
+    """
+    scene = bpy.context.scene
+    if scene_hash is None:
+        scene_hash = get_scene_hash()
+    parameters = [getattr(LF, name) for name in HASHED_PROPERTIES]
+    parameters += [scene.frame_current, get_render_state(), scene_hash]
+
+    # position and orientation of the camera grid
+    try:
+        lightfield = bpy.data.objects[LF.get_lightfield_name()]
+        parameters += [list(row) for row in lightfield.matrix_world]
+    except KeyError:
+        pass
+
+    return get_entry_hash(json.dumps(parameters, default=str))
+
+
+def get_entry_hash(parameter_hash, *values):
+    """
+    Hash of a single output, derived from the parameter hash and the values specific to the output
+    """
+    return hashlib.sha1(json.dumps([parameter_hash] + list(values), default=str).encode('utf-8')).hexdigest()
@@ -0,0 +1,83 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+# The add-on modules import bpy and mathutils at module level, which only exist inside Blender.
+# Minimal stand-ins are installed here so that the pure numpy functions of the add-on can be
+# imported and tested with a plain Python interpreter. Nothing from Blender is emulated: the
+# stubs only provide the names that are looked up while the modules are imported.
+#
+# pytest imports the add-on __init__.py as the package of the tests directory, the tests
+# import the add-on modules through the alias 'plenoptic_addon' that does not depend on the
+# name of the checkout, e.g.
+#
+#   from plenoptic_addon.lightfield_simulator import median_downsampling
+
+import os
+import sys
+import types
+import tempfile
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROPERTY_NAMES = ('BoolProperty', 'BoolVectorProperty', 'IntProperty', 'IntVectorProperty',
+                  'FloatProperty', 'FloatVectorProperty', 'StringProperty', 'EnumProperty',
+                  'PointerProperty', 'CollectionProperty')
+
+
+def stub_property(**options):
+    return options
+
+
+def install_bpy_stub():
+    bpy = types.ModuleType('bpy')
+    bpy.props = types.ModuleType('bpy.props')
+    bpy.props.__all__ = PROPERTY_NAMES
+    for name in PROPERTY_NAMES:
+        setattr(bpy.props, name, stub_property)
+
+    # every bpy.types name is an empty class, so operators and panels can derive from it
+    bpy.types = types.ModuleType('bpy.types')
+    bpy.types.__getattr__ = lambda name: type(name, (), {})
+
+    bpy.path = types.ModuleType('bpy.path')
+    bpy.path.abspath = os.path.abspath
+    # read by the defaults of LFPropertyGroup
+    bpy.context = types.SimpleNamespace(
+        preferences=types.SimpleNamespace(filepaths=types.SimpleNamespace(temporary_directory=tempfile.gettempdir())))
+
+    # pointcloud_simulator decorates its exporter with orientation_helper
+    bpy_extras = types.ModuleType('bpy_extras')
+    bpy_extras.io_utils = types.ModuleType('bpy_extras.io_utils')
+    bpy_extras.io_utils.ImportHelper = type('ImportHelper', (), {})
+    bpy_extras.io_utils.ExportHelper = type('ExportHelper', (), {})
+    bpy_extras.io_utils.axis_conversion = lambda **options: None
+    bpy_extras.io_utils.orientation_helper = lambda **options: (lambda cls: cls)
+
+    mathutils = types.ModuleType('mathutils')
+    mathutils.__all__ = ()
+
+    modules = {'bpy': bpy, 'bpy.props': bpy.props, 'bpy.types': bpy.types, 'bpy.path': bpy.path,
+               'bpy_extras': bpy_extras, 'bpy_extras.io_utils': bpy_extras.io_utils, 'mathutils': mathutils}
+    for name, module in modules.items():
+        sys.modules.setdefault(name, module)
+
+
+def install_addon_package():
+    package = types.ModuleType('plenoptic_addon')
+    package.__path__ = [ADDON_DIR]
+    sys.modules.setdefault('plenoptic_addon', package)
+
+
+install_bpy_stub()
+install_addon_package()
@@ -0,0 +1,89 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+# Regression tests and benchmark of the lenslet assembly against the per pixel loop that
+# getLensletImage used before, e.g.
+#
+#   python -m pytest -s tests/test_lenslet.py
+
+import time
+
+import numpy as np
+
+from plenoptic_addon.lightfield_simulator import lenslet_interleave, lenslet_views
+
+
+def lenslet_loop(image_list, num_cams_x, num_cams_y, x_res, y_res):
+    # the former getLensletImage loop, it only handles square grids of square views
+    lenslet_im = np.zeros((y_res * num_cams_y, x_res * num_cams_x, 3), dtype=np.uint8)
+    idx = 0
+    for u in range(0, num_cams_x):
+        for v in range(0, num_cams_y):
+            im = image_list[idx]
+            for ii in range(0, x_res):
+                for jj in range(0, y_res):
+                    lenslet_im[(ii * num_cams_x) + u, (jj * num_cams_y) + v] = im[ii, jj]
+            idx += 1
+    return lenslet_im
+
+
+def random_views(num_views_v, num_views_u, height, width):
+    return np.random.default_rng(0).integers(0, 256, (num_views_v, num_views_u, height, width, 3), dtype=np.uint8)
+
+
+def test_lenslet_interleave_matches_loop():
+    views = random_views(5, 5, 24, 24)
+    expected = lenslet_loop(list(views.reshape((25, 24, 24, 3))), 5, 5, 24, 24)
+    assert np.array_equal(lenslet_interleave(views), expected)
+
+
+def test_lenslet_views_inverts_interleave():
+    views = random_views(3, 4, 10, 7)
+    lenslet = lenslet_interleave(views)
+    assert lenslet.shape == (30, 28, 3)
+    assert np.array_equal(lenslet_views(lenslet, 3, 4), views)
+
+
+def test_lenslet_views_writes_into_lenslet():
+    views = random_views(3, 4, 10, 7)
+    lenslet = np.zeros((30, 28, 3), dtype=np.uint8)
+    lenslet_grid = lenslet_views(lenslet, 3, 4)
+    for v in range(3):
+        for u in range(4):
+            lenslet_grid[v, u] = views[v, u]
+    assert np.array_equal(lenslet, lenslet_interleave(views))
+
+
+def test_lenslet_benchmark():
+    num_views, resolution = 5, 96
+    views = random_views(num_views, num_views, resolution, resolution)
+    image_list = list(views.reshape((-1, resolution, resolution, 3)))
+
+    start = time.perf_counter()
+    expected = lenslet_loop(image_list, num_views, num_views, resolution, resolution)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lenslet = np.empty_like(expected)
+    lenslet_grid = lenslet_views(lenslet, num_views, num_views)
+    for idx, image in enumerate(image_list):
+        lenslet_grid[divmod(idx, num_views)] = image
+    vectorized_time = time.perf_counter() - start
+
+    print("\nlenslet %ix%i views of %ix%i: loop %.3f s, vectorized %.4f s (%.0fx)"
+          % (num_views, num_views, resolution, resolution, loop_time, vectorized_time,
+             loop_time / max(vectorized_time, 1e-9)))
+    assert np.array_equal(lenslet, expected)
+    assert vectorized_time < loop_time
@@ -0,0 +1,148 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+# Tests of the reader on a tiny 2x2 light field that is written both as PNG files and as a
+# light field container, the PNG and the container reader have to return the same slices.
+
+import numpy as np
+import pytest
+
+from plenoptic_addon.lightfield_container import LightFieldContainer
+from plenoptic_addon.lightfield_reader import LightFieldReader
+from plenoptic_addon.pfm import write_pfm
+
+NUM_CAMS_Y, NUM_CAMS_X = 2, 2
+Y_RES, X_RES = 48, 40
+
+
+def write_parameters(tgt_dir):
+    (tgt_dir / 'parameters.cfg').write_text("[extrinsics]\nnum_cams_x = %d\nnum_cams_y = %d\n\n"
+                                            "[intrinsics]\nimage_resolution_x_px = %d\n"
+                                            "image_resolution_y_px = %d\n" % (NUM_CAMS_X, NUM_CAMS_Y, X_RES, Y_RES))
+
+
+def make_light_field(tgt_dir):
+    # RGB views, low resolution depth and disparity maps and object ids of every view
+    rng = np.random.default_rng(0)
+    views = rng.integers(0, 256, (NUM_CAMS_Y, NUM_CAMS_X, Y_RES, X_RES, 3), dtype=np.uint8)
+    depth = rng.uniform(1.0, 10.0, (NUM_CAMS_Y * NUM_CAMS_X, Y_RES // 2, X_RES // 2)).astype(np.float32)
+    disp = rng.uniform(-2.0, 2.0, depth.shape).astype(np.float32)
+    object_ids = rng.integers(0, 8, (NUM_CAMS_Y * NUM_CAMS_X, Y_RES, X_RES), dtype=np.uint8)
+    write_parameters(tgt_dir)
+    return views, {'depth': depth, 'disp': disp, 'object_ids': object_ids}
+
+
+def write_png_light_field(tgt_dir, views, maps):
+    cv2 = pytest.importorskip('cv2')
+    for idx in range(0, NUM_CAMS_Y * NUM_CAMS_X):
+        cv2.imwrite(str(tgt_dir / ('input_Cam%3.3i.png' % idx)), views[divmod(idx, NUM_CAMS_X)][:, :, ::-1])
+        write_pfm(maps['depth'][idx], str(tgt_dir / ('gt_depth_lowres_Cam%3.3i.pfm' % idx)))
+        write_pfm(maps['disp'][idx], str(tgt_dir / ('gt_disp_lowres_Cam%3.3i.pfm' % idx)))
+        cv2.imwrite(str(tgt_dir / ('objectids_highres_Cam%3.3i.png' % idx)), maps['object_ids'][idx])
+
+
+def write_container_light_field(tgt_dir, views, maps):
+    camera_indices = list(range(0, NUM_CAMS_Y * NUM_CAMS_X))
+    arrays = {'rgb': {'shape': views.shape, 'dtype': views.dtype}}
+    for name, data in maps.items():
+        arrays[name] = {'shape': data.shape, 'dtype': data.dtype, 'views': camera_indices}
+    container = LightFieldContainer.create(str(tgt_dir / 'lightfield.lfc'), {}, arrays)
+    container['rgb'][:] = views
+    for name, data in maps.items():
+        container[name][:] = data
+    container.close()
+
+
+@pytest.fixture
+def light_field(tmp_path):
+    png_dir, container_dir = tmp_path / 'png', tmp_path / 'container'
+    png_dir.mkdir()
+    container_dir.mkdir()
+    views, maps = make_light_field(png_dir)
+    write_png_light_field(png_dir, views, maps)
+    write_parameters(container_dir)
+    write_container_light_field(container_dir, views, maps)
+    return views, maps, LightFieldReader(str(png_dir)), LightFieldReader(str(container_dir))
+
+
+def test_readers_return_the_views(light_field):
+    views, maps, png_reader, container_reader = light_field
+    assert png_reader.container is None and container_reader.container is not None
+    for v in range(0, NUM_CAMS_Y):
+        for u in range(0, NUM_CAMS_X):
+            assert np.array_equal(png_reader.get_view(v, u), views[v, u])
+            assert np.array_equal(container_reader.get_view(v, u), views[v, u])
+
+
+def test_readers_return_the_same_epis(light_field):
+    views, maps, png_reader, container_reader = light_field
+    for v, y in [(0, 0), (1, 17), (1, Y_RES - 1)]:
+        epi = png_reader.get_horizontal_epi(v, y)
+        assert np.array_equal(epi, views[v, :, y])
+        assert np.array_equal(container_reader.get_horizontal_epi(v, y), epi)
+    for u, x in [(0, 0), (1, 23), (1, X_RES - 1)]:
+        epi = png_reader.get_vertical_epi(u, x)
+        assert np.array_equal(epi, views[:, u, :, x])
+        assert np.array_equal(container_reader.get_vertical_epi(u, x), epi)
+
+
+def test_readers_return_the_same_neighbourhoods(light_field):
+    views, maps, png_reader, container_reader = light_field
+    for y, x in [(0, 0), (20, 13), (Y_RES - 1, X_RES - 1)]:
+        neighbourhood = png_reader.get_neighbourhood(y, x, 2)
+        expected = views[:, :, max(y - 2, 0):y + 3, max(x - 2, 0):x + 3].reshape((-1,) + neighbourhood.shape[1:])
+        assert np.array_equal(neighbourhood, expected)
+        assert np.array_equal(container_reader.get_neighbourhood(y, x, 2), neighbourhood)
+
+
+def test_readers_return_the_same_maps(light_field):
+    views, maps, png_reader, container_reader = light_field
+    for name, data in maps.items():
+        for idx in range(0, NUM_CAMS_Y * NUM_CAMS_X):
+            v, u = divmod(idx, NUM_CAMS_X)
+            assert np.array_equal(png_reader.get_map(name, v, u), data[idx])
+            assert np.array_equal(container_reader.get_map(name, v, u), data[idx])
+
+
+def test_epis_of_a_decoded_camera_row_decode_nothing(light_field):
+    views, maps, png_reader, container_reader = light_field
+    png_reader.get_horizontal_epi(1, 4)
+    num_decoded = png_reader.num_decoded
+    assert num_decoded == NUM_CAMS_X
+
+    epi = png_reader.get_horizontal_epi(1, 5)
+    assert png_reader.num_decoded == num_decoded
+    assert np.array_equal(epi, views[1, :, 5])
+
+
+def test_only_requested_and_readahead_rows_are_cached(tmp_path):
+    write_parameters(tmp_path)
+    reader = LightFieldReader(str(tmp_path), readahead_rows=4)
+    image = np.zeros((Y_RES, X_RES, 3), dtype=np.uint8)
+    reader.decode_view = lambda v, u: image
+
+    reader.get_horizontal_epi(0, 10)
+    assert sorted(reader.rows) == [(0, u, y) for u in range(0, NUM_CAMS_X) for y in range(10, 15)]
+
+
+def test_cached_rows_do_not_keep_the_decoded_image(tmp_path):
+    write_parameters(tmp_path)
+    reader = LightFieldReader(str(tmp_path), cache_mb=0.004)
+    image = np.zeros((Y_RES, X_RES, 3), dtype=np.uint8)
+    reader.cache_rows(0, 0, image)
+
+    assert 0 < reader.num_bytes <= reader.cache_bytes
+    assert sum(row.nbytes for row in reader.rows.values()) == reader.num_bytes
+    assert not any(np.shares_memory(row, image) for row in reader.rows.values())
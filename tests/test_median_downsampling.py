@@ -0,0 +1,95 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+# Bit-exact tests and benchmark of median_downsampling against the split and sort
+# implementation it replaced, e.g.
+#
+#   python -m pytest -s tests/test_median_downsampling.py
+
+import time
+
+import numpy as np
+import pytest
+
+from plenoptic_addon.lightfield_simulator import median_downsampling
+
+
+def median_downsampling_sort(img, tile_height, tile_width):
+    # the former implementation, kept verbatim as the reference
+    h, w = np.shape(img)
+    if w % tile_width or h % tile_height:
+        raise Exception("Image dimensions must be multiple of tile dimensions.")
+    n_tiles_horiz = w / tile_width
+    n_tiles_vert = h / tile_height
+    n_tiles = n_tiles_horiz * n_tiles_vert
+    tiles_vert = np.asarray(np.split(img, int(n_tiles_vert), 0))
+    tiles_vert = tiles_vert.transpose([1, 0, 2]).reshape(int(tile_height), int(n_tiles_vert * w))
+    tiles = np.asarray(np.split(tiles_vert, n_tiles, 1))
+    tiles = tiles.reshape(int(n_tiles), int(tile_width * tile_height))
+    tiles = np.sort(tiles, axis=1)[:, int(tile_width*tile_height/2)]
+    small_img = tiles.reshape(int(n_tiles_vert), int(n_tiles_horiz))
+    return small_img
+
+
+def random_map(shape, seed=0):
+    # depth like values with background at infinity and a few invalid pixels
+    rng = np.random.default_rng(seed)
+    img = rng.uniform(0.5, 20.0, shape)
+    img[rng.random(shape) < 0.05] = np.inf
+    img[rng.random(shape) < 0.01] = np.nan
+    return img
+
+
+@pytest.mark.parametrize('tile_height, tile_width', [(1, 1), (2, 2), (3, 3), (4, 4), (2, 3), (5, 1)])
+def test_median_downsampling_matches_sort(tile_height, tile_width):
+    img = random_map((tile_height * 12, tile_width * 7))
+    expected = median_downsampling_sort(img, tile_height, tile_width)
+    result = median_downsampling(img, tile_height, tile_width)
+    assert result.shape == expected.shape
+    assert result.dtype == expected.dtype
+    assert np.array_equal(result, expected, equal_nan=True)
+
+
+def test_median_downsampling_of_ties_matches_sort():
+    img = np.random.default_rng(1).integers(0, 3, (32, 32)).astype(np.float64)
+    assert np.array_equal(median_downsampling(img, 4, 4), median_downsampling_sort(img, 4, 4))
+
+
+def test_median_downsampling_batch_matches_single_maps():
+    depth, disp = random_map((24, 24), seed=2), random_map((24, 24), seed=3)
+    result = median_downsampling(np.stack((depth, disp)), 4, 4)
+    assert np.array_equal(result[0], median_downsampling_sort(depth, 4, 4), equal_nan=True)
+    assert np.array_equal(result[1], median_downsampling_sort(disp, 4, 4), equal_nan=True)
+
+
+def test_median_downsampling_rejects_partial_tiles():
+    with pytest.raises(Exception):
+        median_downsampling(np.zeros((10, 12)), 4, 4)
+
+
+def test_median_downsampling_benchmark():
+    img, scale = random_map((1024, 1024)), 4
+
+    start = time.perf_counter()
+    expected = median_downsampling_sort(img, scale, scale)
+    sort_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = median_downsampling(img, scale, scale)
+    partition_time = time.perf_counter() - start
+
+    print("\nmedian_downsampling 1024x1024 by %i: sort %.3f s, partition %.3f s (%.1fx)"
+          % (scale, sort_time, partition_time, sort_time / max(partition_time, 1e-9)))
+    assert np.array_equal(result, expected, equal_nan=True)
@@ -0,0 +1,125 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+# Round trip tests and benchmark of the binary and ASCII PLY writer, e.g.
+#
+#   python -m pytest -s tests/test_ply.py
+
+import json
+import time
+
+import numpy as np
+import pytest
+
+from plenoptic_addon.pointcloud_simulator import write_ply, write_ply_octree
+
+
+def read_ply(path):
+    # minimal reader of the vertex element written by write_ply
+    with open(path, 'rb') as ply_file:
+        data = ply_file.read()
+    header_size = data.index(b'end_header\n') + len(b'end_header\n')
+    header = data[:header_size].decode('ascii').splitlines()
+    ply_format = header[1].split()[1]
+    num_vertices = int(header[2].split()[2])
+    ply_types = {'float': '<f4', 'uchar': 'u1'}
+    properties = [(line.split()[2], ply_types[line.split()[1]]) for line in header
+                  if line.startswith('property ') and not line.startswith('property list')]
+
+    if ply_format == 'binary_little_endian':
+        vertices = np.frombuffer(data, dtype=properties, count=num_vertices, offset=header_size)
+    else:
+        rows = [line.split() for line in data[header_size:].decode('ascii').splitlines()]
+        assert len(rows) == num_vertices
+        vertices = np.array([tuple(float(value) if prop_type == '<f4' else int(value)
+                                   for value, (name, prop_type) in zip(row, properties)) for row in rows],
+                            dtype=properties)
+    return vertices, header_size
+
+
+def random_point_cloud(num_points, seed=0):
+    # coordinates are multiples of 1/64, so that the six decimals of the ASCII format are exact
+    rng = np.random.default_rng(seed)
+    points = (rng.integers(-640, 640, (num_points, 3)) / 64).astype(np.float32)
+    normals = (rng.integers(-64, 65, (num_points, 3)) / 64).astype(np.float32)
+    colors = rng.integers(0, 256, (num_points, 3), dtype=np.uint8)
+    return points, normals, colors
+
+
+@pytest.mark.parametrize('use_ascii', [False, True])
+@pytest.mark.parametrize('with_normals', [False, True])
+def test_write_ply_round_trip(tmp_path, use_ascii, with_normals):
+    points, normals, colors = random_point_cloud(1000)
+    path = str(tmp_path / 'cloud.ply')
+    header_size = write_ply(path, points, colors, normals if with_normals else None, use_ascii=use_ascii)
+
+    vertices, read_header_size = read_ply(path)
+    assert header_size == read_header_size
+    assert len(vertices) == len(points)
+    assert np.array_equal(np.stack((vertices['x'], vertices['y'], vertices['z']), axis=1), points)
+    assert np.array_equal(np.stack((vertices['diffuse_red'], vertices['diffuse_green'],
+                                    vertices['diffuse_blue']), axis=1), colors)
+    if with_normals:
+        assert np.array_equal(np.stack((vertices['nx'], vertices['ny'], vertices['nz']), axis=1), normals)
+    else:
+        assert 'nx' not in vertices.dtype.names
+
+
+def test_write_ply_empty(tmp_path):
+    path = str(tmp_path / 'empty.ply')
+    header_size = write_ply(path, np.zeros((0, 3)), np.zeros((0, 3), dtype=np.uint8))
+    vertices, read_header_size = read_ply(path)
+    assert header_size == read_header_size
+    assert len(vertices) == 0
+
+
+def test_write_ply_benchmark(tmp_path):
+    points, normals, colors = random_point_cloud(200000)
+
+    start = time.perf_counter()
+    write_ply(str(tmp_path / 'ascii.ply'), points, colors, normals, use_ascii=True)
+    ascii_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    write_ply(str(tmp_path / 'binary.ply'), points, colors, normals)
+    binary_time = time.perf_counter() - start
+
+    print("\nwrite_ply %d points with normals: ascii %.3f s, binary %.4f s (%.0fx)"
+          % (len(points), ascii_time, binary_time, ascii_time / max(binary_time, 1e-9)))
+    assert binary_time < ascii_time
+
+
+def test_write_ply_octree_of_empty_point_cloud(tmp_path):
+    path = str(tmp_path / 'empty.ply')
+    write_ply_octree(path, np.zeros((0, 3)), np.zeros((0, 3), dtype=np.uint8), num_levels=3)
+    with open(str(tmp_path / 'empty_lod.json')) as index_file:
+        index = json.load(index_file)
+    assert index['num_points'] == 0
+    assert index['levels'] == []
+
+
+def test_write_ply_octree_levels(tmp_path):
+    points, normals, colors = random_point_cloud(5000)
+    path = str(tmp_path / 'cloud.ply')
+    write_ply_octree(path, points, colors, num_levels=3, node_resolution=4)
+    with open(str(tmp_path / 'cloud_lod.json')) as index_file:
+        index = json.load(index_file)
+
+    assert [level['level'] for level in index['levels']] == [0, 1, 2]
+    last_level = index['levels'][-1]
+    vertices, header_size = read_ply(str(tmp_path / last_level['file']))
+    assert last_level['num_points'] == len(points) == len(vertices)
+    assert sum(node[10] for node in last_level['nodes']) == len(points)
+    assert last_level['nodes'][0][9] == header_size
@@ -0,0 +1,47 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+import os
+
+import numpy as np
+
+from plenoptic_addon.render_cache import RenderCache
+
+
+KEY_A = 'a' * 40
+KEY_B = 'b' * 40
+
+
+def test_foreign_files_are_not_counted_or_evicted(tmp_path):
+    foreign_path = tmp_path / 'notes.txt'
+    foreign_path.write_bytes(b'x' * 4096)
+    os.utime(foreign_path, (0, 0))
+
+    cache = RenderCache(str(tmp_path), max_bytes=2048)
+    assert cache.total_bytes == 0
+
+    cache.store_array(KEY_A, np.zeros(128))
+    os.utime(cache.get_path(KEY_A, '.npy'), (1, 1))
+    cache.store_array(KEY_B, np.zeros(128))
+    assert foreign_path.exists()
+    assert not os.path.exists(cache.get_path(KEY_A, '.npy'))
+    assert os.path.exists(cache.get_path(KEY_B, '.npy'))
+
+
+def test_overwriting_an_array_is_counted_once(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=1024 * 1024)
+    cache.store_array(KEY_A, np.zeros(128))
+    cache.store_array(KEY_A, np.zeros(128))
+    assert cache.total_bytes == os.path.getsize(cache.get_path(KEY_A, '.npy'))
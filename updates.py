@@ -48,12 +48,48 @@ import bpy
 from bpy.props import *
 
 import os
+from contextlib import contextmanager
+
+
+# Nesting depth of batched_updates() and whether a light field update was requested within it
+_batch_depth = 0
+_batch_pending = False
+
+
+@contextmanager
+def batched_updates(update=True):
+    """
+    Suspends the light field updates of the properties set within the block, e.g.
+
+        with updates.batched_updates():
+            LF.num_cams_x = 9
+            LF.focal_length = 50
+
+    Requested updates are merged into one update at the end of the outermost block,
+    which is skipped with update=False if the caller rebuilds the light field itself.
+    """
+    global _batch_depth, _batch_pending
+    _batch_depth += 1
+    try:
+        yield
+    finally:
+        _batch_depth -= 1
+        pending = _batch_pending and _batch_depth == 0
+        if _batch_depth == 0:
+            _batch_pending = False
+
+    if pending and update:
+        bpy.ops.scene.update_lightfield('EXEC_DEFAULT')
 
 
 def update_lightfield(self, context):
     """
     update function for light field
     """
+    global _batch_pending
+    if _batch_depth > 0:
+        _batch_pending = True
+        return
     bpy.ops.scene.update_lightfield('EXEC_DEFAULT')
 
 
@@ -0,0 +1,209 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+import bpy
+
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .pfm import read_pfm
+
+
+class ViewStore:
+    """
+    In-memory cache of decoded views shared by the post-processing stages, keyed by
+    (tgt_dir, camera, frame, kind), e.g. kind 'input' for the rendered perspective. Each view
+    remembers the modification time and size of its file, so that views of files rewritten by
+    other processes (e.g. render farm workers) are decoded again. Once the decoded views exceed
+    max_bytes the least recently used ones are dropped.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.views = OrderedDict()
+        self.num_bytes = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(tgt_dir, camera, frame, kind):
+        return os.path.normpath(bpy.path.abspath(tgt_dir)), camera, frame, kind
+
+    def put(self, tgt_dir, camera, frame, kind, image, path=None):
+        # path is the file the view was read from or written to, a view without file is only
+        # returned to readers that do not pass a path
+        if path is not None:
+            path = os.path.normpath(path)
+        self.insert(self.get_key(tgt_dir, camera, frame, kind), image, path, get_file_signature(path))
+
+    def insert(self, key, image, path, signature):
+        with self.lock:
+            if key in self.views:
+                self.num_bytes -= self.views.pop(key)[0].nbytes
+            if image.nbytes > self.max_bytes:
+                return
+            self.views[key] = (image, path, signature)
+            self.num_bytes += image.nbytes
+            self.evict()
+
+    def discard(self, tgt_dir, camera, frame, kind):
+        # drops a view whose file was written again
+        key = self.get_key(tgt_dir, camera, frame, kind)
+        with self.lock:
+            if key in self.views:
+                self.num_bytes -= self.views.pop(key)[0].nbytes
+
+    def set_max_bytes(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.evict()
+
+    def evict(self):
+        # called with the lock held
+        while self.num_bytes > self.max_bytes:
+            key, evicted = self.views.popitem(last=False)
+            self.num_bytes -= evicted[0].nbytes
+
+    def get(self, tgt_dir, camera, frame, kind, path=None):
+        """
+        Decoded view of the key, read from path on a miss or if the stored view was read from
+        another file or the file changed since. None if the view is neither stored nor readable.
+        Views must not be modified, they are shared by all readers.
+        """
+        key = self.get_key(tgt_dir, camera, frame, kind)
+        if path is not None:
+            path = os.path.normpath(path)
+            signature = get_file_signature(path)
+        with self.lock:
+            entry = self.views.get(key)
+            if entry is not None:
+                image, entry_path, entry_signature = entry
+                if path is None or (entry_signature is not None and (entry_path, entry_signature) == (path, signature)):
+                    self.views.move_to_end(key)
+                    return image
+
+        if path is None or signature is None:
+            return None
+        # the signature is taken before decoding, so that a file changed meanwhile is decoded again
+        image = read_image(path)
+        if image is not None:
+            self.insert(key, image, path, signature)
+        return image
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+            self.num_bytes = 0
+
+
+def get_file_signature(path):
+    # Modification time and size of the file, None if there is no file
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_image(path):
+    # PFM maps are loaded completely, so that the store does not keep files open
+    import cv2
+
+    if path.endswith('.pfm'):
+        return np.array(read_pfm(path))
+    return cv2.imread(path)
+
+
+def iter_decoded(function, items, num_workers):
+    # Yields function(item) for all items in order, computed by num_workers threads ahead of the
+    # consumer. At most num_workers results are decoded but not consumed yet.
+    with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix='LF_decoder') as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(function, item))
+            if len(pending) >= num_workers:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+
+def load_view_grid(LF, tgt_dir, allocate=np.empty):
+    """
+    Decodes the input views of the camera grid in parallel into one (v, u, y, x, c) array, which
+    is created by allocate(shape, dtype) once the shape of the views is known. Returns None if a
+    view is missing.
+    """
+    tgt_dir = bpy.path.abspath(tgt_dir)
+    frame = bpy.context.scene.frame_current
+    view_store = get_view_store(LF)
+    num_views_v = LF.num_cams_y
+    num_views_u = LF.num_cams_x
+
+    def decode(idx):
+        camera_name = 'Cam%3.3i' % idx
+        path = os.path.join(tgt_dir, 'input_%s.png' % camera_name)
+        image = view_store.get(tgt_dir, camera_name, frame, 'input', path)
+        if image is None:
+            print("Could not read view '%s'." % path)
+        return image
+
+    start = time.perf_counter()
+
+    # the first view gives the shape of the array
+    image = decode(0)
+    if image is None:
+        return None
+    views = allocate((num_views_v, num_views_u) + image.shape, np.uint8)
+    views[0, 0] = image
+
+    def decode_into(idx):
+        image = decode(idx)
+        if image is not None:
+            views[divmod(idx, num_views_u)] = image
+        return image is not None
+
+    with ThreadPoolExecutor(max_workers=LF.decode_workers, thread_name_prefix='LF_decoder') as pool:
+        decoded = all(pool.map(decode_into, range(1, num_views_v * num_views_u)))
+    if not decoded:
+        return None
+
+    duration = max(time.perf_counter() - start, 1e-6)
+    print("Decoded %d view(s) with %d worker(s) in %.3f s (%.1f views/s, %.1f MB/s)"
+          % (num_views_v * num_views_u, LF.decode_workers, duration, num_views_v * num_views_u / duration,
+             views.nbytes / duration / 1e6))
+    return views
+
+
+# Store shared by all operators of the session
+_view_store = None
+
+
+def get_view_store(LF):
+    """
+    Shared view store with the memory cap of the light field settings
+    """
+    global _view_store
+    max_bytes = LF.view_store_size_mb * 1024 * 1024
+    if _view_store is None:
+        _view_store = ViewStore(max_bytes)
+    elif _view_store.max_bytes != max_bytes:
+        _view_store.set_max_bytes(max_bytes)
+    return _view_store
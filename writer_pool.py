@@ -0,0 +1,86 @@
+############################################################################
+#  This work, "Plenoptic Data Rendering", is a derivative of "4D Light     #
+#  Field Benchmark" by Katrin Honauer & Ole Johannsen used under           #
+#  Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International #
+#  License (http://creativecommons.org/licenses/by-nc-sa/4.0/)             #
+#                              and                                         #
+#  "Stanford PLY Format" by Bruce Merry & Campbell Barton used under       #
+#  GNU General Public License version 3.0 (GPLv3)                          #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) / Desaturated from original #
+#                                                                          #
+#  "Plenoptic Data Rendering" is licensed under GPLv3                      #
+#  (https://www.gnu.org/licenses/gpl-3.0.html) by Daniel Albares Martin    #
+#                                                                          #
+############################################################################
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class WriterPool:
+    """
+    Bounded thread pool for encoding and writing output files while the next view is rendered.
+    submit() blocks once max_pending tasks are queued or running, so that at most max_pending
+    views are held in memory. Errors of the tasks are raised by flush().
+    """
+
+    def __init__(self, max_workers=2, max_pending=2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='LF_writer')
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.futures = []
+        self.pending = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.num_tasks = 0
+        self.max_queue_depth = 0
+        self.total_latency = 0.
+        self.max_latency = 0.
+        self.total_blocked = 0.
+
+    def submit(self, fn, *args, **kwargs):
+        start = time.perf_counter()
+        self.slots.acquire()
+        self.total_blocked += time.perf_counter() - start
+
+        with self.lock:
+            self.pending += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.pending)
+        submitted = time.perf_counter()
+
+        def task():
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                latency = time.perf_counter() - submitted
+                with self.lock:
+                    self.pending -= 1
+                    self.num_tasks += 1
+                    self.total_latency += latency
+                    self.max_latency = max(self.max_latency, latency)
+                self.slots.release()
+
+        self.futures.append(self.executor.submit(task))
+
+    def flush(self):
+        """
+        Waits for all submitted tasks, prints the queue statistics and raises the first error
+        """
+        futures, self.futures = self.futures, []
+        errors = [future.exception() for future in futures]
+
+        if self.num_tasks > 0:
+            print("Writer pool: %d task(s), max queue depth %d, mean latency %.3f s, max latency %.3f s, "
+                  "render loop blocked for %.3f s" % (self.num_tasks, self.max_queue_depth,
+                                                      self.total_latency / self.num_tasks, self.max_latency,
+                                                      self.total_blocked))
+        self.reset_stats()
+
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def close(self):
+        self.executor.shutdown(wait=True)